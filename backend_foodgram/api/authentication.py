@@ -0,0 +1,78 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from . import metrics
+from .invalidation import bus
+from .lru import LocalLRUCache
+
+User = get_user_model()
+
+REVALIDATE_CHUNK = 500
+
+local_tokens = LocalLRUCache(
+    settings.TOKEN_LOCAL_CACHE_SIZE, settings.TOKEN_LOCAL_CACHE_TTL)
+
+
+def user_state(user):
+    """Значения полей пользователя, кроме last_login."""
+    return tuple(field.value_from_object(user)
+                 for field in user._meta.concrete_fields
+                 if field.name != 'last_login')
+
+
+def revalidate_tokens():
+    """Сверяет кэш токенов процесса с базой.
+    Удаляет только удаленные токены и токены пользователей, данные
+    которых изменились; остальные записи остаются в кэше.
+    """
+    cached = local_tokens.items()
+    for start in range(0, len(cached), REVALIDATE_CHUNK):
+        chunk = dict(cached[start:start + REVALIDATE_CHUNK])
+        current = {
+            user.token_key: user_state(user)
+            for user in User.objects.filter(
+                auth_token__key__in=chunk
+            ).annotate(token_key=F('auth_token__key'))
+        }
+        for key, user in chunk.items():
+            if current.get(key) != user_state(user):
+                local_tokens.delete(key)
+
+
+bus.register('tokens', revalidate_tokens)
+
+
+def invalidate_tokens(keys):
+    """Удаляет токены из кэша процесса.
+    Другие процессы по новому поколению пространства имен tokens
+    сверяют свои кэши токенов с базой (revalidate_tokens).
+    """
+    for key in keys:
+        local_tokens.delete(key)
+    bus.bump('tokens')
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кэшированием пользователя.
+    Пользователь ищется в LRU-кэше процесса (TOKEN_LOCAL_CACHE_TTL)
+    и только потом в базе. Пользователи не сохраняются во внешние
+    кэши: объект содержит хеш пароля. Кэш сбрасывается сигналами при
+    удалении токена (logout) и изменении пользователя, в других
+    процессах -- через api.invalidation.
+    """
+
+    def authenticate_credentials(self, key):
+        user = local_tokens.get(key)
+        if user is not None:
+            metrics.incr('auth.local_hit')
+            user = copy.deepcopy(user)
+            return (user, Token(key=key, user=user))
+        metrics.incr('auth.miss')
+        user, _ = super().authenticate_credentials(key)
+        local_tokens.set(key, copy.deepcopy(user))
+        return (user, Token(key=key, user=user))
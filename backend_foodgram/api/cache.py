@@ -0,0 +1,135 @@
+"""Кэш сериализованных рецептов.
+
+Не зависящая от пользователя часть рецепта (фрагмент) хранится в кэше
+`fragments` в виде готового JSON под ключом из id и версии рецепта.
+Версией служит дата изменения рецепта, которую обновляют сигналы
+приложения recipes, поэтому после правки рецепта старые фрагменты
+просто перестают запрашиваться и вытесняются по LRU.
+Для списков отдельно кэшируются карточки рецептов (без текста и
+ингредиентов), которые собираются без загрузки ингредиентов.
+Флаги текущего пользователя накладываются на фрагмент при ответе.
+
+Справочники (теги, ингредиенты) хранятся в кэше по умолчанию целиком
+в виде готовых данных ответа. Ключ справочника содержит поколение
+пространства имен `catalog:<имя>`, которое сигналы увеличивают при
+изменении справочника (см. api.invalidation).
+"""
+import orjson
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from .invalidation import bus
+
+RECIPE_FRAGMENT_KEY = 'recipe:{id}:{version}'
+RECIPE_CARD_KEY = 'recipe-card:{id}:{version}'
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60 * 24
+CATALOG_KEY = 'catalog:{name}:{generation}'
+
+fragments = caches['fragments']
+
+
+encode = orjson.dumps
+decode = orjson.loads
+
+
+def recipe_version(updated) -> int:
+    """Возвращает версию рецепта по дате его изменения."""
+    return int(updated.timestamp() * 1_000_000)
+
+
+def recipe_fragment_key(recipe_id, updated, card=False) -> str:
+    return (RECIPE_CARD_KEY if card else RECIPE_FRAGMENT_KEY).format(
+        id=recipe_id, version=recipe_version(updated))
+
+
+def recipe_etag(recipe_id, updated, flags) -> str:
+    """Возвращает ETag рецепта с учетом флагов текущего пользователя."""
+    bits = ''.join('1' if flag else '0' for flag in flags)
+    return f'"{recipe_id}-{recipe_version(updated)}-{bits}"'
+
+
+def build_recipe_fragments(recipes, card=False) -> dict:
+    """Сериализует рецепты (или их карточки) без учета текущего
+    пользователя.
+    Возвращает словарь {id рецепта: (ключ кэша, JSON фрагмента)}.
+    """
+    from .serializers import RecipeCardSerializer, RecipeReadSerializer
+
+    serializer_class = RecipeCardSerializer if card else RecipeReadSerializer
+    serializer = serializer_class(context={'request': None})
+    return {
+        recipe.pk: (recipe_fragment_key(recipe.pk, recipe.updated, card),
+                    encode(serializer.to_representation(recipe)))
+        for recipe in recipes
+    }
+
+
+def get_recipe_fragments(versions, loader, card=False) -> dict:
+    """Возвращает фрагменты рецептов одним обращением к кэшу.
+    versions -- словарь {id рецепта: дата изменения}
+    loader -- функция, загружающая рецепты по списку id при промахе
+    card -- вернуть карточки рецептов вместо полных фрагментов
+    Возвращает словарь {id рецепта: фрагмент}.
+    """
+    keys = {pk: recipe_fragment_key(pk, updated, card)
+            for pk, updated in versions.items()}
+    found = fragments.get_many(keys.values())
+    encoded = {}
+    missing = []
+    for pk, key in keys.items():
+        if key in found:
+            encoded[pk] = found[key]
+        else:
+            missing.append(pk)
+    if missing:
+        built = build_recipe_fragments(loader(missing), card)
+        fragments.set_many(dict(built.values()), RECIPE_FRAGMENT_TIMEOUT)
+        encoded.update((pk, raw) for pk, (_, raw) in built.items())
+    return {pk: decode(raw) for pk, raw in encoded.items()}
+
+
+def delete_recipe_fragment(recipe_id, updated):
+    fragments.delete_many([recipe_fragment_key(recipe_id, updated, card)
+                           for card in (False, True)])
+
+
+def personalize_recipe(fragment, request, is_favorited=False,
+                       is_in_shopping_cart=False, is_subscribed=False,
+                       fields=None):
+    """Оставляет во фрагменте поля fields (если переданы), накладывает
+    флаги текущего пользователя и строит абсолютную ссылку на картинку.
+    """
+    if fields is not None:
+        fragment = {name: fragment[name] for name in fields}
+    if 'author' in fragment:
+        fragment['author']['is_subscribed'] = is_subscribed
+    if 'is_favorited' in fragment:
+        fragment['is_favorited'] = is_favorited
+    if 'is_in_shopping_cart' in fragment:
+        fragment['is_in_shopping_cart'] = is_in_shopping_cart
+    if fragment.get('image'):
+        fragment['image'] = request.build_absolute_uri(fragment['image'])
+    return fragment
+
+
+def catalog_key(name) -> str:
+    """Ключ текущего поколения справочника name."""
+    return CATALOG_KEY.format(
+        name=name, generation=bus.generation(f'catalog:{name}'))
+
+
+def get_catalog(name, loader):
+    """Возвращает справочник name из кэша, загружая его через loader()
+    при промахе.
+    """
+    key = catalog_key(name)
+    data = cache.get(key)
+    if data is None:
+        data = loader()
+        cache.set(key, data, settings.CATALOG_CACHE_TTL)
+    return data
+
+
+def drop_catalog(name):
+    """Объявляет справочник name устаревшим во всех процессах."""
+    bus.bump(f'catalog:{name}')
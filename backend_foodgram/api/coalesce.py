@@ -0,0 +1,64 @@
+"""Объединение одинаковых параллельных запросов (single flight).
+
+Пока для ключа выполняется вычисление, остальные потоки процесса с тем
+же ключом ждут его результат, а не повторяют работу. Результат на
+короткое время (COALESCE_TTL) сохраняется в кэше Django, что покрывает
+запросы, пришедшие сразу после вычисления. Кэш `default` локален для
+процесса, поэтому объединение работает в пределах одного процесса:
+другие рабочие процессы и узлы вычисляют результат сами.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+COALESCE_KEY = 'coalesce:{key}'
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_lock = threading.Lock()
+
+
+def single_flight(key, compute):
+    """Возвращает результат compute() для ключа key,
+    вычисляя его не более одного раза для одновременных запросов.
+    """
+    cache_key = COALESCE_KEY.format(
+        key=hashlib.sha1(key.encode()).hexdigest())
+    result = cache.get(cache_key)
+    if result is not None:
+        metrics.incr('coalesce.cached')
+        return result
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+    if not leader:
+        call.done.wait()
+        metrics.incr('coalesce.shared')
+        if call.error is not None:
+            raise call.error
+        return call.result
+    metrics.incr('coalesce.computed')
+    try:
+        call.result = compute()
+        cache.set(cache_key, call.result, settings.COALESCE_TTL)
+        return call.result
+    except Exception as error:
+        call.error = error
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+        call.done.set()
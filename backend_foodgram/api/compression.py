@@ -0,0 +1,131 @@
+"""Сжатие ответов API.
+
+Сжимаются только JSON-ответы по адресам /api/: HTML-страницы
+(админка) с CSRF-токенами не сжимаются, чтобы не открывать атаку
+BREACH. Кодировка выбирается по заголовку Accept-Encoding среди
+доступных: br (пакет Brotli), zstd (пакет zstandard) и gzip. Если пакет
+не установлен, кодировка просто не предлагается.
+Ответы меньше COMPRESSION_MIN_SIZE байт не сжимаются: выигрыш меньше
+одного сетевого пакета не окупает время сжатия.
+
+Тела, одинаковые для многих запросов (справочники, страницы рецептов
+для анонимных пользователей), помечаются функцией shared с ключом,
+который меняется вместе с телом: поколением справочника, ETag рецепта
+и т. п. Сжатые варианты хранятся в кэше `fragments` рядом с фрагментами
+рецептов под ключом из кодировки и этого ключа. При попадании в кэш
+ответ не отрисовывается и тело не хешируется, а после изменения данных
+старые варианты вытесняются по LRU.
+"""
+import gzip
+import hashlib
+
+from django.conf import settings
+
+from . import metrics
+from .cache import fragments
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSED_KEY = 'compressed:{encoding}:{digest}'
+COMPRESSED_TIMEOUT = 60 * 60
+COMPRESSIBLE_TYPES = ('application/json',)
+COMPRESSIBLE_PATH = '/api/'
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+
+def compress_gzip(body, level=GZIP_LEVEL):
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def compress_brotli(body, level=BROTLI_QUALITY):
+    return brotli.compress(body, quality=level)
+
+
+def compress_zstd(body, level=ZSTD_LEVEL):
+    # ZstdCompressor нельзя использовать из нескольких потоков.
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+# Доступные кодировки в порядке предпочтения сервера.
+CODECS = {}
+if brotli is not None:
+    CODECS['br'] = compress_brotli
+if zstandard is not None:
+    CODECS['zstd'] = compress_zstd
+CODECS['gzip'] = compress_gzip
+
+
+def negotiate(accept_encoding):
+    """Возвращает кодировку с наибольшим весом q из Accept-Encoding
+    (при равных весах -- по порядку CODECS) или None.
+    """
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for encoding in CODECS:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compressible(request, response) -> bool:
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    return (request.path.startswith(COMPRESSIBLE_PATH)
+            and not response.streaming
+            and not response.has_header('Content-Encoding')
+            and content_type in COMPRESSIBLE_TYPES
+            and len(response.content) >= settings.COMPRESSION_MIN_SIZE)
+
+
+def compressed_key(key, encoding) -> str:
+    return COMPRESSED_KEY.format(
+        encoding=encoding,
+        digest=hashlib.blake2b(key.encode(), digest_size=16).hexdigest())
+
+
+def cached_compressed(key, encoding):
+    """Возвращает сжатый вариант общего тела с ключом key или None."""
+    compressed = fragments.get(compressed_key(key, encoding))
+    if compressed is not None:
+        metrics.incr(f'compression.{encoding}.cached')
+    return compressed
+
+
+def compress(body, encoding, key=None) -> bytes:
+    """Сжимает тело ответа. Если передан ключ общего тела key, сжатый
+    вариант сохраняется в кэш.
+    """
+    metrics.incr(f'compression.{encoding}.computed')
+    compressed = CODECS[encoding](body)
+    if key is not None:
+        fragments.set(compressed_key(key, encoding), compressed,
+                      COMPRESSED_TIMEOUT)
+    return compressed
+
+
+def shared(response, key):
+    """Помечает ответ, тело которого одинаково для многих запросов
+    с тем же ключом key: его сжатые варианты кэшируются.
+    """
+    response.shared_key = key
+    return response
@@ -0,0 +1,125 @@
+"""Удаление пользователей с большим количеством данных.
+
+Обычное удаление через Collector загружает в память все связанные
+строки и отправляет сигналы для каждой из них. Здесь связанные таблицы
+очищаются пачками запросами
+    DELETE FROM t WHERE id IN (SELECT id FROM t WHERE ... LIMIT n)
+каждая пачка -- в своей короткой транзакции. Вместо сигналов на каждый
+объект события записываются пачками: записи об удалении в журнал
+изменений рецептов, освобождение картинок, пересчет рейтингов,
+сброс кэшей процессов.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (Favorite, ImageBlob, Recipe, RecipeChange,
+                            RecipeIngredient, ShoppingCart)
+from users.models import Subscription
+
+from .authentication import invalidate_tokens
+from .invalidation import bus
+
+User = get_user_model()
+
+CHUNK_SIZE = 1000
+
+
+def delete_chunk(queryset, chunk_size) -> int:
+    """Удаляет не больше chunk_size строк queryset одним запросом.
+    Возвращает количество удаленных строк.
+    """
+    model = queryset.model
+    pk = model._meta.pk.column
+    subquery, params = queryset.order_by().values('pk')[
+        :chunk_size].query.sql_with_params()
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {quote(pk)} IN ({subquery})', params)
+        return cursor.rowcount
+
+
+def delete_all(queryset, chunk_size, progress) -> int:
+    """Удаляет все строки queryset пачками по chunk_size."""
+    total = 0
+    while True:
+        deleted = delete_chunk(queryset, chunk_size)
+        total += deleted
+        if deleted:
+            progress(queryset.model._meta.verbose_name_plural, total)
+        if deleted < chunk_size:
+            return total
+
+
+def delete_recipes(recipes, chunk_size, progress) -> int:
+    """Удаляет рецепты queryset и их связи пачками по chunk_size
+    рецептов. В журнал изменений пишется одна запись об удалении
+    на рецепт, ссылки на картинки освобождаются пачкой.
+    """
+    tags = Recipe.tags.through.objects
+    total = 0
+    while True:
+        chunk = list(recipes.order_by('pk').values_list(
+            'pk', 'image')[:chunk_size])
+        if not chunk:
+            return total
+        ids = [pk for pk, _ in chunk]
+        for queryset in (RecipeIngredient.objects.filter(recipe_id__in=ids),
+                         tags.filter(recipe_id__in=ids),
+                         Favorite.objects.filter(recipe_id__in=ids),
+                         ShoppingCart.objects.filter(recipe_id__in=ids)):
+            delete_all(queryset, chunk_size, progress)
+        with transaction.atomic():
+            delete_chunk(Recipe.objects.filter(pk__in=ids), len(ids))
+            RecipeChange.record(ids, RecipeChange.DELETED)
+            ImageBlob.release(image for _, image in chunk)
+        total += len(ids)
+        progress(Recipe._meta.verbose_name_plural, total)
+
+
+def related_querysets(user_ids) -> tuple:
+    """Возвращает QuerySet'ы строк, удаляемых вместе с пользователями."""
+    return (
+        Recipe.objects.filter(author_id__in=user_ids),
+        RecipeIngredient.objects.filter(recipe__author_id__in=user_ids),
+        Favorite.objects.filter(user_id__in=user_ids),
+        ShoppingCart.objects.filter(user_id__in=user_ids),
+        Subscription.objects.filter(author_id__in=user_ids),
+        Subscription.objects.filter(subscriber_id__in=user_ids),
+    )
+
+
+def related_counts(user_ids) -> dict:
+    """Возвращает количество удаляемых строк по моделям."""
+    counts = {}
+    for queryset in related_querysets(user_ids):
+        name = queryset.model._meta.verbose_name_plural
+        counts[name] = counts.get(name, 0) + queryset.count()
+    return counts
+
+
+def delete_user(user_id, chunk_size=CHUNK_SIZE, progress=None):
+    """Удаляет пользователя и все его данные пачками по chunk_size.
+    progress(название модели, удалено строк) вызывается после каждой
+    пачки.
+    """
+    progress = progress or (lambda name, total: None)
+    # Рейтинги рецептов, из которых удаляются добавления пользователя.
+    for model in (Favorite, ShoppingCart):
+        Recipe.objects.filter(pk__in=model.objects.filter(
+            user_id=user_id).values('recipe_id')).update(score_updated=None)
+    delete_recipes(
+        Recipe.objects.filter(author_id=user_id), chunk_size, progress)
+    for queryset in (Favorite.objects.filter(user_id=user_id),
+                     ShoppingCart.objects.filter(user_id=user_id),
+                     Subscription.objects.filter(author_id=user_id),
+                     Subscription.objects.filter(subscriber_id=user_id)):
+        delete_all(queryset, chunk_size, progress)
+    invalidate_tokens(
+        Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+    # Оставшиеся связи (токен, группы, журнал админки) невелики
+    # и удаляются обычным образом.
+    User.objects.filter(pk=user_id).delete()
+    bus.bump('recipes')
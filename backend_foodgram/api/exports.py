@@ -0,0 +1,118 @@
+"""Фоновая генерация списков покупок.
+
+Готовый список покупок (артефакт) хранится в SHOPPING_LIST_ROOT, вне
+публичного MEDIA_ROOT, под именем,
+полученным из хеша содержимого корзины: id рецептов и их версий.
+Повторные скачивания неизменной корзины отдаются из хранилища,
+пока корзина или входящие в нее рецепты не изменятся.
+Генерация выполняется в локальном пуле потоков. Через nginx файлы
+отдаются только по X-Accel-Redirect на внутренний адрес
+SHOPPING_LIST_ACCEL_URL.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+
+from recipes.models import RecipeIngredient, ShoppingCart
+
+from .cache import recipe_version
+from .utils import create_shopping_list
+
+storage = FileSystemStorage(location=settings.SHOPPING_LIST_ROOT,
+                            base_url=settings.SHOPPING_LIST_ACCEL_URL)
+
+# Пул создается при первой задаче уже в рабочем процессе: потоки,
+# запущенные в мастер-процессе gunicorn (preload_app), не переживают fork.
+_executor = {'pool': None}
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def cart_digest(cart) -> str:
+    """Возвращает хеш корзины по парам (id рецепта, дата изменения)."""
+    digest = hashlib.sha256()
+    for recipe_id, updated in sorted(set(cart)):
+        digest.update(f'{recipe_id}:{recipe_version(updated)};'.encode())
+    return digest.hexdigest()
+
+
+def user_cart(user_id) -> list:
+    """Возвращает корзину пользователя: пары (id рецепта, дата
+    изменения рецепта).
+    """
+    return list(ShoppingCart.objects.filter(user_id=user_id).values_list(
+        'recipe_id', 'recipe__updated'))
+
+
+def artifact_name(cart) -> str:
+    """Имя артефакта для корзины. По нему и ищется готовый список,
+    и сохраняется сформированный.
+    """
+    return f'{cart_digest(cart)}.txt'
+
+
+def generate_shopping_list(user_id) -> str:
+    """Формирует список покупок пользователя и сохраняет его в хранилище.
+    Ингредиенты читаются для рецептов той же выборки корзины, по которой
+    вычисляется имя артефакта. Возвращает имя артефакта.
+    """
+    try:
+        cart = user_cart(user_id)
+        rows = list(RecipeIngredient.objects.filter(
+            recipe_id__in=[recipe_id for recipe_id, _ in cart]).values(
+                'ingredient__name', 'ingredient__measurement_unit',
+                'amount').order_by('ingredient__name'))
+    finally:
+        connection.close()
+    name = artifact_name(cart)
+    if not storage.exists(name):
+        content = ''.join(create_shopping_list(rows)).encode()
+        saved = storage.save(name, ContentFile(content))
+        if saved != name:
+            storage.delete(saved)
+    return name
+
+
+def _forget_job(name):
+    with _jobs_lock:
+        _jobs.pop(name, None)
+
+
+def submit_shopping_list(user_id, name):
+    """Запускает генерацию списка покупок с именем name, если она еще
+    не запущена. Возвращает Future, результатом которого будет имя
+    артефакта.
+    """
+    with _jobs_lock:
+        future = _jobs.get(name)
+        if future is None:
+            pool = _executor['pool']
+            if pool is None:
+                pool = _executor['pool'] = ThreadPoolExecutor(
+                    max_workers=settings.SHOPPING_LIST_EXPORT_WORKERS,
+                    thread_name_prefix='shopping-list')
+            future = pool.submit(generate_shopping_list, user_id)
+            future.add_done_callback(lambda _: _forget_job(name))
+            _jobs[name] = future
+    return future
+
+
+def clear_artifacts(max_age) -> int:
+    """Удаляет артефакты старше max_age секунд.
+    Возвращает количество удаленных файлов.
+    """
+    if not storage.exists(''):
+        return 0
+    deadline = time.time() - max_age
+    removed = 0
+    for name in storage.listdir('')[1]:
+        if storage.get_modified_time(name).timestamp() < deadline:
+            storage.delete(name)
+            removed += 1
+    return removed
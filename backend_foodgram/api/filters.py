@@ -7,6 +7,11 @@ User = get_user_model()
 
 
 class RecipeFilter(filters.FilterSet):
+    ORDERINGS = {
+        'trending': ('-score', '-created'),
+        'popular': ('-popularity', '-created'),
+    }
+
     tags = filters.filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
         field_name='tags__slug',
@@ -17,6 +22,9 @@ class RecipeFilter(filters.FilterSet):
         field_name='is_favorited', method='filter_nonmodel_fields')
     is_in_shopping_cart = filters.BooleanFilter(
         field_name='is_in_shopping_cart', method='filter_nonmodel_fields')
+    ordering = filters.ChoiceFilter(
+        choices=(('trending', 'trending'), ('popular', 'popular')),
+        method='filter_ordering')
 
     class Meta:
         model = Recipe
@@ -32,3 +40,7 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(
                 favorites__user=self.request.user)
         return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка по рейтингам, рассчитанным update_recipe_scores."""
+        return queryset.order_by(*self.ORDERINGS[value])
@@ -0,0 +1,117 @@
+"""Сброс кэшей процессов на всех узлах.
+
+Кэши процессов (справочники, токены, кэш фрагментов и т. п.)
+регистрируются под именем пространства имен вместе с функцией сброса.
+При изменении данных пространство имен получает новое поколение
+в таблице CacheGeneration. Каждый процесс не чаще раза в
+INVALIDATION_CHECK_INTERVAL секунд читает таблицу одним запросом
+(InvalidationMiddleware) и сбрасывает кэши, поколение которых
+изменилось. Так кэш становится неактуальным на всех узлах не позже
+чем через INVALIDATION_CHECK_INTERVAL после записи.
+Поколение можно добавлять в ключи общего кэша (generation()),
+тогда старые записи просто перестают читаться.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import CacheGeneration
+
+
+class InvalidationBus:
+
+    def __init__(self):
+        self.callbacks = defaultdict(list)
+        self.generations = {}
+        self.checked = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def register(self, name, callback):
+        """Регистрирует функцию сброса кэша для пространства имен."""
+        self.callbacks[name].append(callback)
+
+    def generation(self, name) -> int:
+        """Возвращает известное процессу поколение пространства имен."""
+        return self.generations.get(name, 0)
+
+    def bump(self, *names):
+        """Объявляет кэши пространств имен устаревшими на всех узлах.
+        Выполняется после фиксации текущей транзакции. Имена,
+        объявленные в одной транзакции (на одном уровне точек
+        сохранения), собираются вместе и записываются одним
+        обработчиком on_commit.
+        """
+        connection = transaction.get_connection()
+        pending = getattr(self.local, 'pending', None)
+        if pending is None or not connection.in_atomic_block:
+            # Вне транзакции обработчик выполняется сразу, а ключи
+            # отмененных транзакций больше не нужны.
+            pending = self.local.pending = {}
+        key = (connection.alias, tuple(connection.savepoint_ids))
+        if key in pending:
+            pending_names, callback = pending[key]
+            # После отката транзакции или точки сохранения Django
+            # забывает ее обработчики on_commit, и имена надо
+            # записывать заново.
+            if any(func is callback
+                   for _, func, *_ in connection.run_on_commit):
+                pending_names.update(names)
+                return
+
+        def callback():
+            self._bump(pending.pop(key, ((), None))[0])
+
+        pending[key] = (set(names), callback)
+        transaction.on_commit(callback, using=connection.alias)
+
+    def _bump(self, names):
+        names = sorted(names)
+        if not names:
+            return
+        updated = CacheGeneration.objects.filter(name__in=names).update(
+            generation=F('generation') + 1)
+        if updated < len(names):
+            existing = set(CacheGeneration.objects.filter(
+                name__in=names).values_list('name', flat=True))
+            for name in names:
+                if name in existing:
+                    continue
+                CacheGeneration.objects.get_or_create(name=name)
+                CacheGeneration.objects.filter(name=name).update(
+                    generation=F('generation') + 1)
+        self.apply(dict(CacheGeneration.objects.filter(
+            name__in=names).values_list('name', 'generation')))
+
+    def apply(self, generations):
+        """Запоминает поколения и сбрасывает кэши, поколение которых
+        изменилось.
+        """
+        with self.lock:
+            changed = [name for name, generation in generations.items()
+                       if self.generations.get(name) != generation]
+            self.generations.update(generations)
+        for name in changed:
+            for callback in self.callbacks.get(name, ()):
+                callback()
+
+    def check(self, force=False):
+        """Сверяет поколения с таблицей, если с прошлой проверки прошло
+        больше INVALIDATION_CHECK_INTERVAL секунд.
+        """
+        now = time.monotonic()
+        checked = self.checked
+        if (not force and checked is not None
+                and now - checked < settings.INVALIDATION_CHECK_INTERVAL):
+            return
+        generations = dict(
+            CacheGeneration.objects.values_list('name', 'generation'))
+        self.apply(generations)
+        self.checked = now
+
+
+bus = InvalidationBus()
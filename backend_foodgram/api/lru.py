@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalLRUCache:
+    """Потокобезопасный LRU-кэш процесса с ограничением размера и TTL."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def items(self):
+        """Возвращает список неустаревших пар (ключ, значение)."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (value, expires)
+                    in self._data.items() if expires >= now]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,55 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from api.authentication import CachedTokenAuthentication, invalidate_tokens
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = """
+        Compares TokenAuthentication with CachedTokenAuthentication:
+        SQL queries and time per authenticated request.
+        A temporary user and token are created and rolled back.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=1000,
+                            help='Requests per measurement.')
+
+    def measure(self, authentication, request, number):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(number):
+                authentication.authenticate(request)
+            elapsed = time.perf_counter() - started
+        return len(queries) / number, elapsed / number
+
+    def handle(self, *args, **options):
+        number = options['number']
+        with transaction.atomic():
+            user = User.objects.create_user(
+                email='bench-auth@example.com', username='bench-auth',
+                first_name='bench', last_name='auth')
+            token = Token.objects.create(user=user)
+            request = APIRequestFactory().get(
+                '/api/recipes/', HTTP_AUTHORIZATION=f'Token {token.key}')
+            invalidate_tokens([token.key])
+            for name, authentication in (
+                    ('TokenAuthentication', TokenAuthentication()),
+                    ('CachedTokenAuthentication',
+                     CachedTokenAuthentication())):
+                queries, seconds = self.measure(
+                    authentication, request, number)
+                self.stdout.write(
+                    f'{name}: {queries:.3f} queries/request, '
+                    f'{seconds * 1e6:.1f} us/request')
+            invalidate_tokens([token.key])
+            transaction.set_rollback(True)
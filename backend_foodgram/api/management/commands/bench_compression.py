@@ -0,0 +1,72 @@
+import timeit
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from api.compression import CODECS, cached_compressed, compress
+from api.renderers import ORJSONRenderer
+from api.serializers import (IngredientSerializer, RecipeCardSerializer,
+                             RecipeReadSerializer, TagSerializer)
+from api.utils import load_recipe_cards
+from recipes.models import Ingredient, Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = """
+        Compares CPU time and bytes saved by each available response
+        encoding on typical API bodies: tag and ingredient catalogs,
+        a page of full recipes and a page of recipe cards. Also
+        measures a hit in the cache of compressed shared bodies.
+        Uses data that is already in the database.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=6,
+                            help='Recipes per page.')
+        parser.add_argument('--number', type=int, default=50,
+                            help='Iterations per measurement.')
+
+    def measure(self, func, number):
+        return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+    def bodies(self, size):
+        context = {'request': None}
+        recipes = Recipe.objects.select_related('author').prefetch_related(
+            'tags', 'recipeingredient_set__ingredient')[:size]
+        reader = RecipeReadSerializer(context=context)
+        card_reader = RecipeCardSerializer(context=context)
+        data = {
+            'tags': TagSerializer(Tag.objects.all(), many=True).data,
+            'ingredients': IngredientSerializer(
+                Ingredient.objects.all(), many=True).data,
+            'recipes': [reader.to_representation(r) for r in recipes],
+            'recipe cards': [
+                card_reader.to_representation(r)
+                for r in load_recipe_cards(Recipe.objects.all())[:size]],
+        }
+        renderer = ORJSONRenderer()
+        return {name: renderer.render(value) for name, value in data.items()}
+
+    def handle(self, *args, **options):
+        number = options['number']
+        self.stdout.write(
+            f'encodings: {", ".join(CODECS)}; bodies smaller than '
+            f'{settings.COMPRESSION_MIN_SIZE} bytes are not compressed')
+        for name, body in self.bodies(options['size']).items():
+            self.stdout.write(f'{name}: {len(body)} bytes')
+            if len(body) < settings.COMPRESSION_MIN_SIZE:
+                continue
+            for encoding, codec in CODECS.items():
+                size = len(codec(body))
+                seconds = self.measure(lambda: codec(body), number)
+                compress(body, encoding, key=f'bench:{name}')
+                cached = self.measure(
+                    lambda: cached_compressed(f'bench:{name}', encoding),
+                    number)
+                self.stdout.write(
+                    f'  {encoding}: {size} bytes '
+                    f'({100 * size / len(body):.1f}%), '
+                    f'{seconds * 1e3:.3f} ms, '
+                    f'{(len(body) - size) / 1024 / seconds / 1e3:.1f} '
+                    f'KB saved per CPU ms, '
+                    f'cached {cached * 1e3:.3f} ms')
@@ -0,0 +1,102 @@
+import timeit
+
+from django.core.management import BaseCommand
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import ORJSONRenderer
+from api.serializers import (RecipeCardSerializer, RecipeIngredientSerializer,
+                             RecipeReadSerializer, TagSerializer,
+                             UserSerializer)
+from api.utils import load_recipe_cards
+from recipes.models import Recipe
+
+
+class LegacyRecipeSerializer(serializers.ModelSerializer):
+    """Прежний сериализатор рецепта на вложенных ModelSerializer."""
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+    image = serializers.ImageField(use_url=True)
+    tags = TagSerializer(many=True, read_only=True)
+    author = UserSerializer(read_only=True)
+    ingredients = RecipeIngredientSerializer(
+        source='recipeingredient_set', many=True, read_only=True)
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
+                  'is_in_shopping_cart', 'name', 'image', 'text',
+                  'cooking_time')
+
+    def get_is_favorited(self, obj):
+        return False
+
+    def get_is_in_shopping_cart(self, obj):
+        return False
+
+
+class Command(BaseCommand):
+    help = """
+        Compares serialization and JSON rendering of a recipe page:
+        ModelSerializer + JSONRenderer against
+        RecipeReadSerializer + ORJSONRenderer and the list card
+        representation (RecipeCardSerializer). Also measures loading
+        of the page for full recipes and for cards.
+        Uses recipes that are already in the database.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=6,
+                            help='Recipes per page.')
+        parser.add_argument('--number', type=int, default=200,
+                            help='Iterations per measurement.')
+
+    def measure(self, func, number):
+        return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+    def handle(self, *args, **options):
+        size = options['size']
+        loaders = {
+            'full': lambda: list(
+                Recipe.objects.select_related('author').prefetch_related(
+                    'tags', 'recipeingredient_set__ingredient')[:size]),
+            'card': lambda: list(
+                load_recipe_cards(Recipe.objects.all())[:size]),
+        }
+        recipes = loaders['full']()
+        if not recipes:
+            self.stderr.write('No recipes in the database.')
+            return
+        cards = loaders['card']()
+        number = options['number']
+        context = {'request': None}
+        reader = RecipeReadSerializer(context=context)
+        card_reader = RecipeCardSerializer(context=context)
+        stacks = {
+            'ModelSerializer + JSONRenderer': (
+                lambda: LegacyRecipeSerializer(
+                    recipes, many=True, context=context).data,
+                JSONRenderer(),
+            ),
+            'RecipeReadSerializer + ORJSONRenderer': (
+                lambda: [reader.to_representation(r) for r in recipes],
+                ORJSONRenderer(),
+            ),
+            'RecipeCardSerializer + ORJSONRenderer': (
+                lambda: [card_reader.to_representation(r) for r in cards],
+                ORJSONRenderer(),
+            ),
+        }
+        self.stdout.write(
+            f'{len(recipes)} recipes per page, {number} iterations')
+        for name, load in loaders.items():
+            load_time = self.measure(load, max(1, number // 10))
+            self.stdout.write(f'load {name}: {load_time * 1e3:.3f} ms')
+        for name, (serialize, renderer) in stacks.items():
+            data = serialize()
+            serialize_time = self.measure(serialize, number)
+            render_time = self.measure(lambda: renderer.render(data), number)
+            self.stdout.write(
+                f'{name}: serialize {serialize_time * 1e3:.3f} ms, '
+                f'render {render_time * 1e3:.3f} ms, '
+                f'{len(renderer.render(data))} bytes')
@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from api.exports import clear_artifacts
+
+
+class Command(BaseCommand):
+    help = """
+        Deletes generated shopping lists older than the given age.
+        Lists are regenerated on the next download.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=7,
+                            help='Maximum age of a shopping list in days.')
+
+    def handle(self, *args, **options):
+        removed = clear_artifacts(options['days'] * 24 * 60 * 60)
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {removed} shopping lists.'))
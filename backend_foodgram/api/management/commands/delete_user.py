@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+
+from api.deletion import CHUNK_SIZE, delete_user, related_counts
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = """
+        Deletes a user with all recipes, favorites, shopping cart items
+        and subscriptions in chunked DELETE statements, each chunk in
+        its own short transaction.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email of the user to delete.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows deleted per statement.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count rows to delete.')
+
+    def progress(self, name, total):
+        self.stdout.write(f'{name}: {total} deleted')
+
+    def handle(self, *args, **options):
+        user_id = User.objects.filter(
+            email=options['email']).values_list('pk', flat=True).first()
+        if user_id is None:
+            raise CommandError(f'User {options["email"]} not found.')
+        for name, count in related_counts([user_id]).items():
+            self.stdout.write(f'{name}: {count}')
+        if options['dry_run']:
+            return
+        delete_user(user_id, options['chunk_size'], self.progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'User {options["email"]} deleted.'))
@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from api.invalidation import bus
+from api.models import CacheGeneration
+
+
+class Command(BaseCommand):
+    help = """
+        Marks process caches as stale on all nodes, e.g. after bulk
+        changes made without model signals. Without arguments all known
+        namespaces are bumped.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*',
+                            help='Namespaces, e.g. catalog:ingredients.')
+
+    def handle(self, *args, **options):
+        names = options['names'] or sorted(
+            set(bus.callbacks).union(
+                CacheGeneration.objects.values_list('name', flat=True)))
+        bus.bump(*names)
+        self.stdout.write(self.style.SUCCESS(
+            f'Invalidated: {", ".join(names)}.'))
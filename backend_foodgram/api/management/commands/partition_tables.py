@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from api.partitioning import (CHUNK_SIZE, TABLES, PartitioningError, backfill,
+                              create_partitioned, drop_unpartitioned,
+                              is_partitioned, start_sync, swap)
+
+
+class Command(BaseCommand):
+    help = """
+        Moves favorites, shopping carts and subscriptions into hash
+        partitioned tables (PostgreSQL only) without downtime: creates
+        the partitioned copy, mirrors writes into it with a trigger,
+        copies existing rows in chunks and, with --swap, replaces the
+        original table.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('tables', nargs='*',
+                            help='Tables to partition (default: all).')
+        parser.add_argument('--partitions', type=int,
+                            default=settings.USER_TABLE_PARTITIONS,
+                            help='Number of hash partitions.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows copied per statement.')
+        parser.add_argument('--swap', action='store_true',
+                            help='Replace the original tables after copying.')
+        parser.add_argument('--drop-old', action='store_true',
+                            help='Drop original tables left after --swap.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning requires PostgreSQL.')
+        unknown = set(options['tables']) - set(TABLES)
+        if unknown:
+            raise CommandError(f'Unknown tables: {", ".join(unknown)}.')
+        for table in options['tables'] or TABLES:
+            if options['drop_old']:
+                drop_unpartitioned(table)
+                self.stdout.write(f'{table}: original table dropped')
+                continue
+            if is_partitioned(table):
+                self.stdout.write(f'{table}: already partitioned')
+                continue
+            if options['partitions'] < 2:
+                raise CommandError(
+                    'Set --partitions or USER_TABLE_PARTITIONS.')
+            create_partitioned(table, options['partitions'])
+            start_sync(table)
+            copied = backfill(
+                table, options['chunk_size'],
+                lambda copied, last_id, max_id: self.stdout.write(
+                    f'{table}: {copied} rows copied, id {last_id}/{max_id}'))
+            self.stdout.write(f'{table}: {copied} rows copied')
+            if not options['swap']:
+                continue
+            try:
+                swap(table)
+            except PartitioningError as error:
+                raise CommandError(error)
+            self.stdout.write(self.style.SUCCESS(f'{table}: partitioned'))
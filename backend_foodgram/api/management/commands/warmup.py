@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.test import Client
+
+from api.warmup import warm_up
+
+URLS = ('/api/tags/', '/api/ingredients/', '/api/recipes/')
+
+
+class Command(BaseCommand):
+    help = """
+        Warms up the process (see api.warmup) and reports the time of
+        every step, then measures latency of the first and the second
+        request to the main read-only endpoints.
+        With --cold the warm-up is skipped to compare the numbers.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cold', action='store_true',
+                            help='Skip the warm-up.')
+
+    def request_ms(self, client, url):
+        started = time.perf_counter()
+        client.get(url)
+        return (time.perf_counter() - started) * 1000
+
+    def handle(self, *args, **options):
+        if not options['cold']:
+            timings = warm_up()
+            for name, seconds in timings:
+                self.stdout.write(f'{name}: {seconds * 1000:.1f} ms')
+            self.stdout.write(
+                f'Warm-up: {sum(s for _, s in timings) * 1000:.1f} ms')
+        host = next((host for host in settings.ALLOWED_HOSTS
+                     if host != '*'), 'localhost')
+        client = Client(HTTP_HOST=host.lstrip('.'))
+        for url in URLS:
+            first = self.request_ms(client, url)
+            second = self.request_ms(client, url)
+            self.stdout.write(
+                f'{url}: first {first:.1f} ms, second {second:.1f} ms')
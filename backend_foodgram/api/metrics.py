@@ -0,0 +1,18 @@
+"""Счетчики событий текущего процесса."""
+import threading
+from collections import Counter
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def incr(name, value=1):
+    """Увеличивает счетчик name на value."""
+    with _lock:
+        _counters[name] += value
+
+
+def snapshot() -> dict:
+    """Возвращает текущие значения всех счетчиков."""
+    with _lock:
+        return dict(_counters)
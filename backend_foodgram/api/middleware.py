@@ -0,0 +1,122 @@
+import hmac
+import random
+import threading
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+from .compression import (COMPRESSIBLE_PATH, COMPRESSIBLE_TYPES,
+                          cached_compressed, compress, compressible, negotiate)
+from .invalidation import bus
+from .profiling import sampler, save_profile
+
+
+class CompressionMiddleware:
+    """Сжимает JSON-ответы API в кодировке, выбранной по Accept-Encoding
+    (см. api.compression). Сжатые варианты тел, помеченных shared,
+    берутся из кэша до отрисовки ответа. Сильный ETag становится
+    слабым: сжатое тело отличается от исходного побайтно.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not compressible(request, response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        return self.encode(response, encoding, compress(
+            response.content, encoding, getattr(response, 'shared_key', None)))
+
+    def process_template_response(self, request, response):
+        """Подставляет сжатое тело общего ответа из кэша, если оно там
+        есть; тогда ответ DRF не отрисовывается.
+        """
+        key = getattr(response, 'shared_key', None)
+        media_type = getattr(
+            getattr(response, 'accepted_renderer', None), 'media_type', None)
+        if (key is None or media_type not in COMPRESSIBLE_TYPES
+                or not request.path.startswith(COMPRESSIBLE_PATH)):
+            return response
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        compressed = encoding and cached_compressed(key, encoding)
+        if not compressed:
+            return response
+        response['Content-Type'] = media_type
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return self.encode(response, encoding, compressed)
+
+    def encode(self, response, encoding, compressed):
+        response.content = compressed
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(len(compressed))
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос, если:
+    - передан заголовок X-Profile со значением PROFILE_HEADER_SECRET;
+    - запрос попал в выборку PROFILE_SAMPLE_RATE;
+    - задан PROFILE_THRESHOLD_MS: профилируются все запросы,
+      сохраняются только выполнявшиеся дольше порога.
+    Если ничего из этого не настроено, middleware отключается
+    при запуске и не влияет на обработку запросов.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.secret = settings.PROFILE_HEADER_SECRET
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE
+        self.threshold = settings.PROFILE_THRESHOLD_MS
+        if not (self.secret or self.sample_rate or self.threshold):
+            raise MiddlewareNotUsed
+
+    def requested(self, request):
+        header = request.headers.get('X-Profile')
+        return bool(self.secret and header
+                    and hmac.compare_digest(header, self.secret))
+
+    def __call__(self, request):
+        forced = self.requested(request)
+        sampled = forced or random.random() < self.sample_rate
+        if not (sampled or self.threshold):
+            return self.get_response(request)
+        profile = sampler.start(threading.get_ident())
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.capture_sql))
+                response = self.get_response(request)
+        finally:
+            sampler.stop(profile)
+        if sampled or profile.duration >= self.threshold:
+            name = save_profile(request, profile)
+            metrics.incr('profile.saved')
+            if forced:
+                response['X-Profile-Id'] = name
+        return response
+
+
+class InvalidationMiddleware:
+    """Перед обработкой запроса сверяет поколения кэшей с базой
+    (не чаще раза в INVALIDATION_CHECK_INTERVAL секунд).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        bus.check()
+        return self.get_response(request)
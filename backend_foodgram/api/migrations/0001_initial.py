@@ -0,0 +1,26 @@
+# Generated by Django 4.1.4 on 2026-10-19 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheGeneration',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Пространство имен')),
+                ('generation', models.BigIntegerField(default=0, verbose_name='Поколение')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Поколение кэша',
+                'verbose_name_plural': 'Поколения кэшей',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.4 on 2026-10-19 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('key', models.CharField(max_length=200, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('tokens', models.FloatField(verbose_name='Токены')),
+                ('updated', models.FloatField(verbose_name='Время пополнения')),
+            ],
+            options={
+                'verbose_name': 'Корзина токенов',
+                'verbose_name_plural': 'Корзины токенов',
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.1.4 on 2026-10-19 10:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_throttle_bucket'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='ThrottleBucket',
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import models
+
+
+class CacheGeneration(models.Model):
+    """Поколение пространства имен кэшей процессов.
+    Увеличивается при изменении данных, процессы сравнивают его
+    со своим и сбрасывают устаревшие кэши (см. api.invalidation).
+    """
+    name = models.CharField('Пространство имен', max_length=100,
+                            primary_key=True)
+    generation = models.BigIntegerField('Поколение', default=0)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Поколение кэша'
+        verbose_name_plural = 'Поколения кэшей'
+
+    def __str__(self):
+        return f'{self.name}: {self.generation}'
@@ -0,0 +1,264 @@
+"""Хеш-секционирование избранного, списка покупок и подписок
+(только PostgreSQL).
+
+Эти таблицы читаются почти всегда по пользователю, поэтому делятся
+на USER_TABLE_PARTITIONS секций по хешу user_id (подписки -- по
+subscriber_id): запрос по пользователю читает одну секцию, индексы
+каждой секции в разы меньше общих.
+
+Таблица переводится без остановки сервиса:
+1. рядом создается пустая секционированная копия <table>_partitioned
+   (миграция или команда partition_tables);
+2. триггер на исходной таблице повторяет в копии все изменения;
+3. существующие строки копируются пачками по id;
+4. сверяется количество строк, и под короткой блокировкой с тайм-аутом
+   таблицы меняются именами. Старая таблица остается как <table>_unpartitioned,
+   пока ее не удалит partition_tables --drop-old.
+Модели и запросы ORM не меняются, на SQLite таблицы остаются обычными.
+Ограничение первичного ключа секционированной таблицы включает ключ
+секционирования: (id, user_id); id по-прежнему выдает последовательность.
+"""
+from typing import NamedTuple
+
+from django.db import OperationalError, connection, transaction
+
+CHUNK_SIZE = 10000
+SWAP_LOCK_TIMEOUT = '5s'
+
+
+class PartitioningError(Exception):
+    pass
+
+
+class PartitionedTable(NamedTuple):
+    key: str
+    # Индексы и уникальные ограничения: (имя, столбцы). Имена из Meta
+    # моделей сохраняются, чтобы следующие миграции их находили.
+    unique: tuple
+    indexes: tuple
+    # Внешние ключи: (столбец, таблица).
+    references: tuple
+
+    def index_names(self):
+        return [name for name, _ in self.unique + self.indexes]
+
+
+TABLES = {
+    'recipes_favorite': PartitionedTable(
+        key='user_id',
+        unique=(('unique_user_favorite_recipe', ('user_id', 'recipe_id')),),
+        indexes=(('favorite_recipe_user_idx', ('recipe_id', 'user_id')),
+                 ('favorite_created_idx', ('created',))),
+        references=(('recipe_id', 'recipes_recipe'),
+                    ('user_id', 'users_user')),
+    ),
+    'recipes_shoppingcart': PartitionedTable(
+        key='user_id',
+        unique=(('unique_user_recipe_in_cart', ('user_id', 'recipe_id')),),
+        indexes=(('cart_recipe_user_idx', ('recipe_id', 'user_id')),
+                 ('cart_created_idx', ('created',))),
+        references=(('recipe_id', 'recipes_recipe'),
+                    ('user_id', 'users_user')),
+    ),
+    'users_subscription': PartitionedTable(
+        key='subscriber_id',
+        unique=(('unique_subscriptions', ('author_id', 'subscriber_id')),),
+        indexes=(('subscription_subscriber_idx',
+                  ('subscriber_id', 'author_id')),),
+        references=(('author_id', 'users_user'),
+                    ('subscriber_id', 'users_user')),
+    ),
+}
+
+
+def partitioned_name(table):
+    return f'{table}_partitioned'
+
+
+def unpartitioned_name(table):
+    return f'{table}_unpartitioned'
+
+
+def relkind(table):
+    """Тип отношения в pg_class: 'r' -- таблица, 'p' --
+    секционированная таблица, None -- таблицы нет.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)',
+            [table])
+        row = cursor.fetchone()
+    return row and row[0]
+
+
+def is_partitioned(table) -> bool:
+    return relkind(table) == 'p'
+
+
+def create_partitioned(table, partitions):
+    """Создает пустую секционированную копию таблицы, если таблица
+    еще не секционирована и копии нет.
+    """
+    spec = TABLES[table]
+    shadow = partitioned_name(table)
+    if is_partitioned(table) or relkind(shadow):
+        return
+    columns = ', '.join
+    constraints = [f'PRIMARY KEY (id, {spec.key})']
+    constraints.extend(
+        f'CONSTRAINT {name}_partitioned UNIQUE ({columns(fields)})'
+        for name, fields in spec.unique)
+    constraints.extend(
+        f'FOREIGN KEY ({column}) REFERENCES {target} (id) '
+        f'DEFERRABLE INITIALLY DEFERRED'
+        for column, target in spec.references)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE {shadow} (LIKE {table}, '
+            f'{", ".join(constraints)}) PARTITION BY HASH ({spec.key})')
+        for name, fields in spec.indexes:
+            cursor.execute(f'CREATE INDEX {name}_partitioned '
+                           f'ON {shadow} ({columns(fields)})')
+        for remainder in range(partitions):
+            cursor.execute(
+                f'CREATE TABLE {table}_p{remainder} PARTITION OF {shadow} '
+                f'FOR VALUES WITH (MODULUS {partitions}, '
+                f'REMAINDER {remainder})')
+
+
+def drop_partitioned(table):
+    """Удаляет секционированную копию и триггер, если перевод
+    таблицы еще не завершен.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {table}_sync ON {table}')
+        cursor.execute(f'DROP FUNCTION IF EXISTS {table}_sync()')
+        cursor.execute(f'DROP TABLE IF EXISTS {partitioned_name(table)}')
+
+
+def start_sync(table):
+    """Ставит на исходную таблицу триггер, повторяющий изменения
+    в секционированной копии. CREATE TRIGGER дожидается завершения
+    начатых транзакций записи, поэтому строки, вставленные до
+    триггера, имеют id не больше MAX(id) после его создания.
+    """
+    spec = TABLES[table]
+    shadow = partitioned_name(table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION {table}_sync() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                    DELETE FROM {shadow}
+                    WHERE id = OLD.id AND {spec.key} = OLD.{spec.key};
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO {shadow} VALUES (NEW.*)
+                    ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql""")
+        cursor.execute(f'DROP TRIGGER IF EXISTS {table}_sync ON {table}')
+        cursor.execute(
+            f'CREATE TRIGGER {table}_sync '
+            f'AFTER INSERT OR UPDATE OR DELETE ON {table} '
+            f'FOR EACH ROW EXECUTE FUNCTION {table}_sync()')
+
+
+def backfill(table, chunk_size=CHUNK_SIZE, progress=None) -> int:
+    """Копирует строки исходной таблицы в секционированную пачками
+    по диапазонам id, каждая пачка в своей транзакции. Копируемые
+    строки блокируются FOR SHARE: удаление, начатое во время
+    копирования, дождется его и удалит строку и из копии.
+    Возвращает количество скопированных строк.
+    """
+    progress = progress or (lambda copied, last_id, max_id: None)
+    shadow = partitioned_name(table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(id), MAX(id) FROM {table}')
+        min_id, max_id = cursor.fetchone()
+    if min_id is None:
+        return 0
+    copied = 0
+    last_id = min_id - 1
+    while last_id < max_id:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {shadow} SELECT * FROM {table} '
+                f'WHERE id > %s AND id <= %s FOR SHARE '
+                f'ON CONFLICT DO NOTHING',
+                [last_id, last_id + chunk_size])
+            copied += cursor.rowcount
+        last_id += chunk_size
+        progress(copied, min(last_id, max_id), max_id)
+    return copied
+
+
+def verify(table):
+    """Сверяет количество строк исходной и секционированной таблиц.
+    Оба подсчета выполняются одним запросом, то есть по одному снимку
+    данных, а триггер меняет обе таблицы в одной транзакции, поэтому
+    блокировка не нужна.
+    """
+    shadow = partitioned_name(table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT (SELECT COUNT(*) FROM {table}), '
+                       f'(SELECT COUNT(*) FROM {shadow})')
+        source, copied = cursor.fetchone()
+    if source != copied:
+        raise PartitioningError(
+            f'{table}: {source} rows, {shadow}: {copied} rows.')
+
+
+def swap(table):
+    """Меняет исходную и секционированную таблицы местами.
+    Количество строк сверяется до блокировки. Остальное выполняется
+    в одной транзакции под исключительной блокировкой, которая ждет
+    не дольше SWAP_LOCK_TIMEOUT: удаляется триггер, копия получает
+    свою последовательность id, у исходной таблицы удаляются внешние
+    ключи (иначе они не дали бы удалять рецепты и пользователей, на
+    которые ссылаются ее строки), таблицы и индексы переименовываются.
+    Если блокировку не удалось получить, транзакция откатывается
+    и ничего не меняется.
+    """
+    spec = TABLES[table]
+    shadow = partitioned_name(table)
+    old = unpartitioned_name(table)
+    sequence = f'{shadow}_id_seq'
+    verify(table)
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+            cursor.execute(
+                f'LOCK TABLE {table}, {shadow} IN ACCESS EXCLUSIVE MODE')
+            cursor.execute(f'DROP TRIGGER {table}_sync ON {table}')
+            cursor.execute(f'DROP FUNCTION {table}_sync()')
+            # Последовательность исходной таблицы удалится вместе с ней.
+            cursor.execute(
+                f'CREATE SEQUENCE {sequence} OWNED BY {shadow}.id')
+            cursor.execute(
+                f"SELECT setval('{sequence}', "
+                f'COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)')
+            cursor.execute(f'ALTER TABLE {shadow} ALTER COLUMN id '
+                           f"SET DEFAULT nextval('{sequence}')")
+            cursor.execute(
+                "SELECT conname FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype = 'f'", [table])
+            for (name,) in cursor.fetchall():
+                cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {name}')
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {old}')
+            for name in spec.index_names():
+                cursor.execute(f'ALTER INDEX IF EXISTS {name} '
+                               f'RENAME TO {name}_unpartitioned')
+                cursor.execute(
+                    f'ALTER INDEX {name}_partitioned RENAME TO {name}')
+            cursor.execute(f'ALTER TABLE {shadow} RENAME TO {table}')
+    except OperationalError as error:
+        raise PartitioningError(
+            f'{table}: lock not acquired, retry --swap ({error}).')
+
+
+def drop_unpartitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {unpartitioned_name(table)}')
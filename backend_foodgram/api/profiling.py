@@ -0,0 +1,174 @@
+"""Выборочный профилировщик запросов.
+
+Фоновый поток раз в PROFILE_INTERVAL_MS снимает стеки потоков,
+зарегистрированных для профилирования (sys._current_frames), и
+накапливает количество одинаковых стеков. Пока профилируемых запросов
+нет, поток спит и не тратит время процесса.
+Результат сохраняется в PROFILE_DIR в формате speedscope
+(https://www.speedscope.app) вместе со списком SQL-запросов.
+В каталоге хранятся последние PROFILE_KEEP профилей.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from itertools import count
+
+import orjson
+from django.conf import settings
+
+MAX_DEPTH = 128
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+
+class Profile:
+    """Стеки и SQL-запросы одного запроса."""
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.queries = []
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def add_stack(self, frame):
+        stack = []
+        while frame is not None and len(stack) < MAX_DEPTH:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        stack.reverse()
+        self.stacks[tuple(stack)] += 1
+
+    def capture_sql(self, execute, sql, params, many, context):
+        """Обертка execute_wrapper: записывает запрос и его время."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                (sql, (time.perf_counter() - started) * 1000))
+
+    def finish(self):
+        self.duration = (time.perf_counter() - self.started) * 1000
+
+    def speedscope(self, name) -> dict:
+        frames = {}
+        samples = []
+        weights = []
+        interval = settings.PROFILE_INTERVAL_MS
+        for stack, hits in self.stacks.items():
+            samples.append([frames.setdefault(frame, len(frames))
+                            for frame in stack])
+            weights.append(hits * interval)
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': name,
+            'shared': {'frames': [
+                {'name': function, 'file': filename, 'line': line}
+                for function, filename, line in frames
+            ]},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+
+    def sql_report(self) -> str:
+        lines = [f'-- {len(self.queries)} queries, '
+                 f'{sum(ms for _, ms in self.queries):.1f} ms']
+        lines.extend(f'-- {ms:.2f} ms\n{sql};' for sql, ms in self.queries)
+        return '\n'.join(lines) + '\n'
+
+
+class Sampler:
+    """Фоновый поток, снимающий стеки зарегистрированных потоков."""
+
+    def __init__(self):
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self, thread_id) -> Profile:
+        profile = Profile(thread_id)
+        with self.lock:
+            self.profiles[thread_id] = profile
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name='profiler', daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+        return profile
+
+    def stop(self, profile):
+        with self.lock:
+            self.profiles.pop(profile.thread_id, None)
+        profile.finish()
+
+    def run(self):
+        interval = settings.PROFILE_INTERVAL_MS / 1000
+        while True:
+            with self.lock:
+                profiles = list(self.profiles.values())
+                if not profiles:
+                    self.wakeup.clear()
+            if not profiles:
+                self.wakeup.wait()
+                continue
+            frames = sys._current_frames()
+            for profile in profiles:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    profile.add_stack(frame)
+            del frames
+            time.sleep(interval)
+
+
+sampler = Sampler()
+_sequence = count(1)
+
+
+def profile_name(request, profile) -> str:
+    slug = re.sub(r'[^a-zA-Z0-9]+', '-', request.path).strip('-')
+    return (f'{time.strftime("%Y%m%d-%H%M%S")}-{profile.duration:.0f}ms-'
+            f'{request.method}-{slug}-{os.getpid()}-{next(_sequence)}')
+
+
+def save_profile(request, profile) -> str:
+    """Сохраняет профиль и список SQL в PROFILE_DIR.
+    Возвращает имя профиля.
+    """
+    directory = settings.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = profile_name(request, profile)
+    with open(os.path.join(directory, f'{name}.speedscope.json'),
+              'wb') as output:
+        output.write(orjson.dumps(profile.speedscope(
+            f'{request.method} {request.get_full_path()}')))
+    with open(os.path.join(directory, f'{name}.sql'), 'w') as output:
+        output.write(profile.sql_report())
+    rotate(directory, settings.PROFILE_KEEP)
+    return name
+
+
+def rotate(directory, keep):
+    """Удаляет самые старые профили, оставляя keep последних."""
+    with os.scandir(directory) as entries:
+        profiles = sorted(
+            (entry.stat().st_mtime, entry.name[:-len('.speedscope.json')])
+            for entry in entries
+            if entry.name.endswith('.speedscope.json'))
+    for _, name in profiles[:max(0, len(profiles) - keep)]:
+        for suffix in ('.speedscope.json', '.sql'):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
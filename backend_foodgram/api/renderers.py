@@ -0,0 +1,21 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSON-рендерер на базе orjson.
+    Типы, которые orjson не знает (ленивые строки, Decimal и т.п.),
+    а также даты передаются стандартному JSONEncoder из DRF,
+    поэтому формат ответа совпадает с JSONRenderer.
+    """
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = self.options
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=JSONEncoder().default,
+                            option=options)
@@ -2,6 +2,7 @@ import base64
 
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
+from django.db import transaction
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from rest_framework import serializers
 
@@ -12,15 +13,48 @@ from users.models import Subscription
 User = get_user_model()
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
-        read_only_fields = ('__all__',)
-
-
-class UserSerializer(DjoserUserSerializer):
+def image_url(image, request=None):
+    """Возвращает ссылку на картинку так же, как ImageField(use_url=True)."""
+    if not image:
+        return None
+    if request is not None:
+        return request.build_absolute_uri(image.url)
+    return image.url
+
+
+class RecipeListSerializer(serializers.BaseSerializer):
+    """Краткое представление рецепта, только для чтения.
+    Собирает словарь напрямую, без полей ModelSerializer.
+    """
+
+    def to_representation(self, recipe):
+        return {
+            'id': recipe.pk,
+            'name': recipe.name,
+            'image': image_url(recipe.image, self.context.get('request')),
+            'cooking_time': recipe.cooking_time,
+        }
+
+
+class SparseFieldsMixin:
+    """Оставляет в сериализаторе только поля из списка `fields`
+    контекста, если он передан (см. requested_fields).
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items()
+                if name in selected}
+
+
+class UserSerializer(SparseFieldsMixin, DjoserUserSerializer):
+    """Пользователь с признаком подписки текущего пользователя.
+    Признак берется из аннотации is_subscribed, если она есть
+    (см. annotate_subscribed).
+    """
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -30,14 +64,21 @@ class UserSerializer(DjoserUserSerializer):
 
     def get_is_subscribed(self, obj):
         """Возвращает True если пользователь подписан на автора."""
-        current_user = self.context.get('request').user
-        if current_user.is_anonymous:
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        request = self.context.get('request')
+        if (request is None or request.user.is_anonymous
+                or request.user.pk == obj.pk):
             return False
         return Subscription.objects.filter(
-            author=obj, subscriber=current_user).exists()
+            author=obj, subscriber=request.user).exists()
 
 
 class SubscriptionSerializer(UserSerializer):
+    """Автор с его рецептами для подписок.
+    Рецепты и их количество берутся из prefetch `limited_recipes`
+    и аннотации recipes_count, если они есть.
+    """
     recipes_count = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
 
@@ -46,14 +87,18 @@ class SubscriptionSerializer(UserSerializer):
 
     def get_recipes_count(self, obj):
         """Возвращает количество рецептов отслеживаемого автора."""
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj)
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes = Recipe.objects.filter(author=obj)
+            limit = self.context.get('recipes_limit')
+            if limit:
+                recipes = recipes[:limit]
         return RecipeListSerializer(recipes, many=True).data
 
 
@@ -82,31 +127,124 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class Base64ImageField(serializers.ImageField):
-    """Декодирует картинку из строки base64."""
+    """Декодирует картинку из строки base64.
+    Имя файла задает хранилище по хешу содержимого.
+    """
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            name = {self.context["request"].user.username}
-            data = ContentFile(base64.b64decode(imgstr), name=f'{name}.' + ext)
+            data = ContentFile(base64.b64decode(imgstr), name=f'image.{ext}')
         return super().to_internal_value(data)
 
 
+# Поля полного представления рецепта и карточки рецепта для списков.
+RECIPE_FIELDS = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
+                 'is_in_shopping_cart', 'name', 'image', 'text',
+                 'cooking_time')
+RECIPE_CARD_FIELDS = tuple(
+    name for name in RECIPE_FIELDS if name not in ('ingredients', 'text'))
+
+
+class RecipeCardSerializer(serializers.BaseSerializer):
+    """Карточка рецепта для списков: рецепт без текста и ингредиентов.
+    Собирает словарь напрямую, без вложенных ModelSerializer.
+    Ожидает рецепт с загруженными author и tags. Флаги пользователя
+    берутся из аннотаций рецепта, если они есть (см. annotate_user_flags).
+    """
+
+    def _user_flag(self, recipe, name, exists):
+        if hasattr(recipe, name):
+            return getattr(recipe, name)
+        request = self.context.get('request')
+        if request is None or request.user.is_anonymous:
+            return False
+        return exists(request.user)
+
+    def get_is_favorited(self, recipe):
+        """Возвращает True, если рецепт в Избранном пользователя."""
+        return self._user_flag(
+            recipe, 'is_favorited', lambda user: Favorite.objects.filter(
+                recipe=recipe, user=user).exists())
+
+    def get_is_in_shopping_cart(self, recipe):
+        """Возвращает True, если рецепт в Списке покупок пользователя."""
+        return self._user_flag(
+            recipe, 'is_in_shopping_cart',
+            lambda user: ShoppingCart.objects.filter(
+                recipe=recipe, user=user).exists())
+
+    def get_is_subscribed(self, recipe):
+        """Возвращает True, если пользователь подписан на автора."""
+        return self._user_flag(
+            recipe, 'is_subscribed', lambda user: Subscription.objects.filter(
+                author_id=recipe.author_id, subscriber=user).exists())
+
+    def get_tags(self, recipe):
+        return [{'id': tag.pk, 'name': tag.name, 'color': tag.color,
+                 'slug': tag.slug}
+                for tag in recipe.tags.all()]
+
+    def get_author(self, recipe):
+        author = recipe.author
+        return {
+            'email': author.email,
+            'id': author.pk,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            'is_subscribed': self.get_is_subscribed(recipe),
+        }
+
+    def to_representation(self, recipe):
+        return {
+            'id': recipe.pk,
+            'tags': self.get_tags(recipe),
+            'author': self.get_author(recipe),
+            'is_favorited': self.get_is_favorited(recipe),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+            'name': recipe.name,
+            'image': image_url(recipe.image, self.context.get('request')),
+            'cooking_time': recipe.cooking_time,
+        }
+
+
+class RecipeReadSerializer(RecipeCardSerializer):
+    """Полное представление рецепта, только для чтения.
+    Ожидает рецепт с загруженными author, tags и
+    recipeingredient_set__ingredient.
+    """
+
+    def to_representation(self, recipe):
+        return {
+            'id': recipe.pk,
+            'tags': self.get_tags(recipe),
+            'author': self.get_author(recipe),
+            'ingredients': [
+                {'id': item.ingredient.pk, 'name': item.ingredient.name,
+                 'measurement_unit': item.ingredient.measurement_unit,
+                 'amount': item.amount}
+                for item in recipe.recipeingredient_set.all()
+            ],
+            'is_favorited': self.get_is_favorited(recipe),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+            'name': recipe.name,
+            'image': image_url(recipe.image, self.context.get('request')),
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+
+
 class RecipeSerializer(serializers.ModelSerializer):
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    """Создание и изменение рецепта.
+    Ответ формируется через RecipeReadSerializer.
+    """
     image = Base64ImageField(use_url=True)
-    tags = TagSerializer(many=True, read_only=True)
-    author = UserSerializer(read_only=True)
-    ingredients = RecipeIngredientSerializer(
-        source='recipeingredient_set', many=True, read_only=True)
 
     class Meta:
         model = Recipe
-        fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+        fields = ('id', 'name', 'image', 'text', 'cooking_time')
 
     def validate(self, data):
         for field in ('tags', 'ingredients', 'name', 'text', 'cooking_time'):
@@ -128,21 +266,9 @@ class RecipeSerializer(serializers.ModelSerializer):
             ingredients_ids.add(ingredient['id'])
         return data
 
-    def get_is_favorited(self, obj):
-        """Возвращает True, если рецепт в Избранном пользователя."""
-        current_user = self.context['request'].user
-        if current_user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            recipe=obj, user=current_user).exists()
-
-    def get_is_in_shopping_cart(self, obj):
-        """Возвращает True, если рецепт в Списке покупок пользователя."""
-        current_user = self.context['request'].user
-        if current_user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(
-            recipe=obj, user=current_user).exists()
+    def to_representation(self, instance):
+        return RecipeReadSerializer(
+            instance, context=self.context).to_representation(instance)
 
     def _create_recipe_ingredient_objects(self, recipe, ingredients):
         """Вспомогательный метод.
@@ -154,23 +280,33 @@ class RecipeSerializer(serializers.ModelSerializer):
         RecipeIngredient.objects.bulk_create(obj)
 
     def create(self, validated_data):
+        """Рецепт, ингредиенты и теги создаются в одной транзакции,
+        поэтому рецепт становится виден сразу целиком.
+        """
         tags = self.initial_data.get('tags')
         ingredients = self.initial_data.pop('ingredients')
-        recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
-        self._create_recipe_ingredient_objects(recipe, ingredients)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            with Recipe.touch_suppressed(recipe.pk):
+                self._create_recipe_ingredient_objects(recipe, ingredients)
+                recipe.tags.set(tags)
         return recipe
 
     def update(self, instance, validated_data):
+        """Изменяет рецепт в одной транзакции. Версия рецепта
+        обновляется один раз при его сохранении, а не по каждому
+        ингредиенту и тегу.
+        """
         ingredients = self.initial_data.pop('ingredients')
-        RecipeIngredient.objects.filter(recipe=instance).all().delete()
-        self._create_recipe_ingredient_objects(instance, ingredients)
         tags = self.initial_data.get('tags')
-        instance.tags.set(tags)
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time)
-        instance.save()
+        with transaction.atomic(), Recipe.touch_suppressed(instance.pk):
+            RecipeIngredient.objects.filter(recipe=instance).delete()
+            self._create_recipe_ingredient_objects(instance, ingredients)
+            instance.tags.set(tags)
+            instance.image = validated_data.get('image', instance.image)
+            instance.name = validated_data.get('name', instance.name)
+            instance.text = validated_data.get('text', instance.text)
+            instance.cooking_time = validated_data.get(
+                'cooking_time', instance.cooking_time)
+            instance.save()
         return instance
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.signals import author_changed, recipes_imported
+
+from .authentication import invalidate_tokens
+from .cache import delete_recipe_fragment, drop_catalog
+from .invalidation import bus
+
+
+@receiver(post_delete, sender=Recipe)
+def drop_recipe_fragment(sender, instance, **kwargs):
+    """Удаляет из кэша фрагмент удаленного рецепта."""
+    delete_recipe_fragment(instance.pk, instance.updated)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def bump_recipes(sender, **kwargs):
+    """Изменение рецептов сбрасывает кэши списков рецептов."""
+    bus.bump('recipes')
+
+
+@receiver(recipes_imported)
+def bump_recipes_on_import(sender, **kwargs):
+    """Загруженные рецепты сбрасывают кэши списков рецептов."""
+    bus.bump('recipes')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipes_on_tags_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bus.bump('recipes')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def drop_tags_catalog(sender, **kwargs):
+    """Изменение тегов сбрасывает кэш справочника тегов."""
+    drop_catalog('tags')
+    bus.bump('recipes')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def drop_ingredients_catalog(sender, **kwargs):
+    """Изменение ингредиентов сбрасывает кэш справочника ингредиентов."""
+    drop_catalog('ingredients')
+    bus.bump('recipes')
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def bump_recipes_on_author_change(sender, instance, created, **kwargs):
+    """Изменение данных автора сбрасывает кэши списков рецептов."""
+    if not created and author_changed(instance):
+        bus.bump('recipes')
+
+
+@receiver(post_delete, sender=Token)
+def drop_cached_token(sender, instance, **kwargs):
+    """Удаление токена (logout) сбрасывает его кэш."""
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def drop_cached_user_tokens(sender, instance, created, update_fields,
+                            **kwargs):
+    """Изменение пользователя сбрасывает кэш всех его токенов."""
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    invalidate_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True))
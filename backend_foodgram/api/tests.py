@@ -0,0 +1,870 @@
+import gzip
+import os
+import re
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes.models import (Favorite, ImageBlob, Ingredient, Recipe,
+                            RecipeChange, RecipeIngredient, ShoppingCart, Tag)
+from users.models import Subscription
+
+from .authentication import CachedTokenAuthentication, local_tokens
+from .cache import fragments
+from .compression import CODECS, negotiate
+from .deletion import delete_user, related_querysets
+from .invalidation import bus
+from .models import CacheGeneration
+from .parsers import ORJSONParser
+from .partitioning import (PartitioningError, backfill, create_partitioned,
+                           drop_partitioned, drop_unpartitioned,
+                           is_partitioned, relkind, start_sync, swap, verify)
+from .renderers import ORJSONRenderer
+from .serializers import RECIPE_CARD_FIELDS, RECIPE_FIELDS
+from .throttles import TokenBucketThrottle
+from .utils import annotate_user_flags
+
+User = get_user_model()
+
+
+class InvalidationBusTests(TestCase):
+
+    def test_bumps_in_transaction_are_written_once(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                for _ in range(3):
+                    bus.bump('recipes')
+                bus.bump('catalog:tags')
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            dict(CacheGeneration.objects.values_list('name', 'generation')),
+            {'recipes': 1, 'catalog:tags': 1})
+
+    def test_rolled_back_savepoint_does_not_block_later_bumps(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        bus.bump('recipes')
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                bus.bump('recipes')
+        self.assertEqual(
+            CacheGeneration.objects.get(name='recipes').generation, 1)
+
+
+class InvalidationBusRollbackTests(TransactionTestCase):
+
+    def test_rolled_back_transaction_does_not_block_later_bumps(self):
+        try:
+            with transaction.atomic():
+                bus.bump('recipes')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        with transaction.atomic():
+            bus.bump('recipes')
+        self.assertEqual(
+            CacheGeneration.objects.get(name='recipes').generation, 1)
+
+
+class ThrottleView:
+    action = 'search'
+    throttle_scopes = {'search': 'test'}
+
+
+@mock.patch.object(TokenBucketThrottle, 'THROTTLE_RATES', {'test': '3/min'})
+class TokenBucketThrottleTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def allow(self, now):
+        request = APIRequestFactory().get('/')
+        request.user = AnonymousUser()
+        throttle = TokenBucketThrottle()
+        throttle.timer = lambda: now
+        return throttle.allow_request(request, ThrottleView()), throttle
+
+    def test_bucket_is_shared_between_instances(self):
+        # SimpleTestCase запрещает запросы к базе.
+        results = [self.allow(now=1000)[0] for _ in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+
+    def test_bucket_expires_when_full(self):
+        _, throttle = self.allow(now=1000)
+        self.assertEqual(cache.get(throttle.key), (2, 1000))
+        with mock.patch.object(cache, 'set') as set_bucket:
+            self.allow(now=1000)
+        self.assertEqual(set_bucket.call_args.args[2], 60)
+
+    def test_busy_bucket_rejects_request(self):
+        _, throttle = self.allow(now=1000)
+        cache.add(f'{throttle.key}:lock', True)
+        with mock.patch('api.throttles.time.sleep'):
+            self.assertFalse(self.allow(now=1000)[0])
+        self.assertEqual(cache.get(throttle.key), (2, 1000))
+
+    def test_bucket_refills_over_time(self):
+        for _ in range(3):
+            self.allow(now=1000)
+        allowed, throttle = self.allow(now=1000)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 20)
+        self.assertTrue(self.allow(now=1020)[0])
+        self.assertFalse(self.allow(now=1020)[0])
+
+
+class WarmUpTests(SimpleTestCase):
+
+    def test_failed_warm_up_does_not_stop_gunicorn(self):
+        config = runpy.run_path(
+            os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'))
+        server = mock.Mock()
+        with mock.patch('api.warmup.warm_up',
+                        side_effect=RuntimeError('database is not ready')):
+            config['when_ready'](server)
+        server.log.warning.assert_called_once()
+
+
+class ShoppingListTests(TransactionTestCase):
+    """Списки покупок формируются в пуле потоков, поэтому данные должны
+    быть зафиксированы в базе.
+    """
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        storage = FileSystemStorage(
+            location=directory.name,
+            base_url=settings.SHOPPING_LIST_ACCEL_URL)
+        for module in ('api.exports', 'api.views'):
+            patcher = mock.patch(f'{module}.storage', storage)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.storage = storage
+        self.user = User.objects.create_user(
+            email='cook@example.com', username='cook', password='x')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Борщ', text='...', cooking_time=60,
+            image='images/borsch.png')
+        beet = Ingredient.objects.create(name='свекла', measurement_unit='г')
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=beet, amount=300)
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_is_served_without_nginx(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('свекла (г): 300',
+                      b''.join(response.streaming_content).decode())
+        self.assertEqual(len(self.storage.listdir('')[1]), 1)
+
+    def test_recipe_without_ingredients_does_not_block_reuse(self):
+        empty = Recipe.objects.create(
+            author=self.user, name='Вода', text='...', cooking_time=1,
+            image='images/water.png')
+        ShoppingCart.objects.create(user=self.user, recipe=empty)
+        self.client.get(self.url)
+        with mock.patch('api.views.submit_shopping_list') as submit:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        submit.assert_not_called()
+
+    def download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_cart_change_regenerates_list(self):
+        self.download()
+        salad = Recipe.objects.create(
+            author=self.user, name='Салат', text='...', cooking_time=5,
+            image='images/salad.png')
+        RecipeIngredient.objects.create(
+            recipe=salad, amount=2, ingredient=Ingredient.objects.create(
+                name='огурец', measurement_unit='шт'))
+        ShoppingCart.objects.create(user=self.user, recipe=salad)
+        self.assertIn('огурец (шт): 2', self.download())
+        ShoppingCart.objects.filter(recipe=salad).delete()
+        self.assertNotIn('огурец', self.download())
+        self.assertEqual(len(self.storage.listdir('')[1]), 2)
+
+    def test_recipe_edit_regenerates_list(self):
+        self.download()
+        item = RecipeIngredient.objects.get(recipe=self.recipe)
+        item.amount = 500
+        item.save()
+        self.assertIn('свекла (г): 500', self.download())
+
+    @override_settings(SHOPPING_LIST_ACCEL_REDIRECT=True)
+    def test_nginx_serves_list_from_internal_location(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.content, b'')
+        self.assertTrue(response['X-Accel-Redirect'].startswith(
+            settings.SHOPPING_LIST_ACCEL_URL))
+
+
+class CompressionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', color=f'#{number:06d}',
+                slug=f'tag-{number}')
+            for number in range(40))
+
+    def setUp(self):
+        cache.clear()
+        fragments.clear()
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate('gzip'), 'gzip')
+        self.assertEqual(negotiate('*'), next(iter(CODECS)))
+        self.assertEqual(negotiate('deflate, gzip;q=0.5'), 'gzip')
+        self.assertIsNone(negotiate('gzip;q=0'))
+        self.assertIsNone(negotiate('identity'))
+        self.assertIsNone(negotiate(''))
+
+    def test_api_json_is_compressed(self):
+        plain = self.client.get('/api/tags/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        response = self.client.get('/api/tags/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_cached_shared_body_is_not_rendered(self):
+        first = self.client.get('/api/tags/', HTTP_ACCEPT_ENCODING='gzip')
+        with mock.patch.object(ORJSONRenderer, 'render') as render:
+            response = self.client.get(
+                '/api/tags/', HTTP_ACCEPT_ENCODING='gzip')
+        render.assert_not_called()
+        self.assertEqual(response.content, first.content)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_html_pages_are_not_compressed(self):
+        response = self.client.get(
+            '/admin/login/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class RecipeFragmentTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        fragments.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author = User.objects.create_user(
+                email='cook@example.com', username='cook', password='x',
+                first_name='Анна')
+            self.recipe = Recipe.objects.create(
+                author=self.author, name='Суп', text='...', cooking_time=10,
+                image='images/recipe.png')
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def names(self):
+        detail = self.client.get(self.url).json()
+        card, = self.client.get('/api/recipes/').json()['results']
+        return ((detail['name'], detail['author']['first_name']),
+                (card['name'], card['author']['first_name']))
+
+    def test_edit_replaces_cached_fragments(self):
+        self.assertEqual(self.names(), (('Суп', 'Анна'),) * 2)
+        self.recipe.name = 'Борщ'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        self.assertEqual(self.names(), (('Борщ', 'Анна'),) * 2)
+
+    def test_author_rename_replaces_cached_fragments(self):
+        self.names()
+        self.author.first_name = 'Мария'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save()
+        self.assertEqual(self.names(), (('Суп', 'Мария'),) * 2)
+
+
+class CachedTokenTests(TestCase):
+
+    def setUp(self):
+        local_tokens.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='old-secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def me(self):
+        return self.client.get('/api/users/me/').status_code
+
+    def test_logout_stops_cached_token(self):
+        self.assertEqual(self.me(), 200)
+        self.assertIsNotNone(local_tokens.get(self.token.key))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me(), 401)
+
+    def test_password_change_stops_cached_token(self):
+        self.assertEqual(self.me(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'old-secret',
+                'new_password': 'new-Secret-42'})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me(), 401)
+
+    def test_other_process_drops_only_changed_users(self):
+        other = User.objects.create_user(
+            email='other@example.com', username='other', password='x')
+        other_token = Token.objects.create(user=other)
+        self.assertEqual(self.me(), 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {other_token.key}')
+        self.assertEqual(self.me(), 200)
+        # Изменение, сделанное другим процессом: сигналы этого процесса
+        # не срабатывают, о нем сообщает только новое поколение tokens.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        bus.apply({'tokens': bus.generation('tokens') + 1})
+        self.assertIsNone(local_tokens.get(self.token.key))
+        self.assertIsNotNone(local_tokens.get(other_token.key))
+
+    def test_cached_user_is_not_shared_between_requests(self):
+        self.assertEqual(self.me(), 200)
+        request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        user, _ = CachedTokenAuthentication().authenticate(request)
+        user.first_name = 'Изменено'
+        user._state.db = 'other'
+        cached = local_tokens.get(self.token.key)
+        self.assertEqual(cached.first_name, '')
+        self.assertEqual(cached._state.db, 'default')
+
+
+class ConditionalRecipeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        fragments.clear()
+        author = User.objects.create_user(
+            email='cook@example.com', username='cook', password='x')
+        self.recipe = Recipe.objects.create(
+            author=author, name='Суп', text='...', cooking_time=10,
+            image='images/recipe.png')
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            updated=timezone.now() - timedelta(minutes=1))
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def test_etag_and_last_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+        for headers in ({'HTTP_IF_NONE_MATCH': etag},
+                        {'HTTP_IF_MODIFIED_SINCE': last_modified}):
+            response = self.client.get(self.url, **headers)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_etag_takes_precedence_over_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH='"stale"',
+            HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_edit_in_same_second_is_not_hidden(self):
+        self.recipe.save()
+        response = self.client.get(self.url)
+        self.assertNotIn('Last-Modified', response)
+        self.recipe.name = 'Борщ'
+        self.recipe.save()
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=http_date(time.time()))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Борщ')
+
+
+class ORJSONTests(SimpleTestCase):
+    data = {
+        'name': 'Суп',
+        'amount': Decimal('1.50'),
+        'created': datetime(2024, 5, 1, 12, 30, 15, 123456,
+                            tzinfo=dt_timezone.utc),
+        'lazy': gettext_lazy('Суп'),
+        'items': [1, None, True, 2.5],
+        1: 'ключ-число',
+    }
+
+    def test_renders_like_json_renderer(self):
+        self.assertEqual(ORJSONRenderer().render(self.data),
+                         JSONRenderer().render(self.data))
+        self.assertEqual(
+            ORJSONRenderer().render(
+                self.data, 'application/json; indent=2').decode(),
+            JSONRenderer().render(
+                self.data, 'application/json; indent=2').decode())
+
+    def test_round_trip(self):
+        body = ORJSONRenderer().render(self.data)
+        self.assertEqual(ORJSONParser().parse(BytesIO(body)),
+                         JSONParser().parse(BytesIO(body)))
+
+    def test_invalid_json_is_parse_error(self):
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{"name": '))
+
+
+class RecipeBatchTests(TestCase):
+    url = '/api/recipes/batch/'
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='cook@example.com', username='cook', password='x')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='...',
+                cooking_time=10, image='images/recipe.png')
+            for number in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        fragments.clear()
+
+    def test_keeps_request_order_and_reports_missing(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        missing = third + 100
+        response = self.client.get(
+            self.url, {'ids': f'{third},{missing},{first},{third}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [third, first])
+        self.assertEqual(response.json()['missing'], [missing])
+
+    def test_post_body(self):
+        ids = [recipe.pk for recipe in reversed(self.recipes)]
+        response = self.client.post(
+            self.url, {'ids': ids}, content_type='application/json')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']], ids)
+
+    def test_invalid_ids(self):
+        for response in (
+                self.client.get(self.url, {'ids': '1,a'}),
+                self.client.post(self.url, {'ids': '1,2'},
+                                 content_type='application/json'),
+                self.client.post(self.url, {'ids': [{'id': 1}]},
+                                 content_type='application/json')):
+            self.assertEqual(response.status_code, 400)
+
+    @override_settings(RECIPE_BATCH_LIMIT=2)
+    def test_limit(self):
+        ids = ','.join(str(recipe.pk) for recipe in self.recipes)
+        response = self.client.get(self.url, {'ids': ids})
+        self.assertEqual(response.status_code, 400)
+
+
+class DeleteUserTests(TestCase):
+
+    def setUp(self):
+        self.user, self.other = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name, password='x')
+            for name in ('cook', 'other'))
+        tag = Tag.objects.create(name='Обед', color='#00ff00', slug='lunch')
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        self.recipes = []
+        for number in range(5):
+            recipe = Recipe.objects.create(
+                author=self.user, name=f'Рецепт {number}', text='...',
+                cooking_time=10, image='images/recipe.png')
+            recipe.tags.add(tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=salt, amount=1)
+            Favorite.objects.create(user=self.other, recipe=recipe)
+            self.recipes.append(recipe.pk)
+        self.kept = Recipe.objects.create(
+            author=self.other, name='Борщ', text='...', cooking_time=10,
+            image='images/borsch.png')
+        self.kept.tags.add(tag)
+        Favorite.objects.create(user=self.user, recipe=self.kept)
+        ShoppingCart.objects.create(user=self.user, recipe=self.kept)
+        Subscription.objects.create(author=self.user, subscriber=self.other)
+        Subscription.objects.create(author=self.other, subscriber=self.user)
+        Token.objects.create(user=self.user)
+
+    def test_deletes_in_chunks_without_orphans(self):
+        progress = mock.Mock()
+        delete_user(self.user.pk, chunk_size=2, progress=progress)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        for queryset in related_querysets([self.user.pk]):
+            self.assertFalse(queryset.exists())
+        for model in (RecipeIngredient, Recipe.tags.through, Favorite,
+                      ShoppingCart):
+            self.assertFalse(model.objects.filter(
+                recipe_id__in=self.recipes).exists())
+        self.assertFalse(Token.objects.exists())
+        progress.assert_any_call(Recipe._meta.verbose_name_plural, 5)
+
+    def test_writes_tombstones_and_releases_images(self):
+        delete_user(self.user.pk, chunk_size=2)
+        self.assertEqual(
+            sorted(RecipeChange.objects.filter(
+                action=RecipeChange.DELETED).values_list(
+                    'recipe_id', flat=True)),
+            self.recipes)
+        self.assertEqual(
+            ImageBlob.objects.get(name='images/recipe.png').refs, 0)
+        self.assertEqual(
+            ImageBlob.objects.get(name='images/borsch.png').refs, 1)
+
+    def test_keeps_other_users_data(self):
+        delete_user(self.user.pk, chunk_size=2)
+        self.kept.refresh_from_db()
+        self.assertEqual(list(self.kept.tags.all()),
+                         list(Tag.objects.all()))
+        self.assertIsNone(self.kept.score_updated)
+        self.assertTrue(User.objects.filter(pk=self.other.pk).exists())
+
+
+class FieldSelectionTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='cook@example.com', username='cook', password='x')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Суп', text='...', cooking_time=10,
+            image='images/recipe.png')
+
+    def setUp(self):
+        cache.clear()
+        fragments.clear()
+
+    def keys(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        if 'results' in data:
+            data, = data['results']
+        return set(data)
+
+    def test_recipe_defaults(self):
+        self.assertEqual(self.keys('/api/recipes/'), set(RECIPE_CARD_FIELDS))
+        self.assertEqual(self.keys(f'/api/recipes/{self.recipe.pk}/'),
+                         set(RECIPE_FIELDS))
+
+    def test_recipe_fields_and_expand(self):
+        self.assertEqual(self.keys('/api/recipes/', fields='name'),
+                         {'id', 'name'})
+        self.assertEqual(self.keys('/api/recipes/', expand='text'),
+                         {*RECIPE_CARD_FIELDS, 'text'})
+        self.assertEqual(
+            self.keys(f'/api/recipes/{self.recipe.pk}/',
+                      fields='name,is_favorited', expand='ingredients'),
+            {'id', 'name', 'is_favorited', 'ingredients'})
+
+    def test_user_fields_and_expand(self):
+        self.client.force_authenticate(self.author)
+        self.assertEqual(
+            self.keys('/api/users/', fields='username',
+                      expand='recipes_count'),
+            {'id', 'username', 'recipes_count'})
+
+    def test_unknown_names_are_rejected(self):
+        self.client.force_authenticate(self.author)
+        for url, params in (('/api/recipes/', {'fields': 'name,secret'}),
+                            (f'/api/recipes/{self.recipe.pk}/',
+                             {'expand': 'password'}),
+                            ('/api/users/', {'expand': 'password'})):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('fields', response.json())
+
+
+LISTENER = '''
+import sys
+from api.invalidation import bus
+dropped = []
+bus.register('recipes', lambda: dropped.append('recipes'))
+bus.check(force=True)
+print(bus.generation('recipes'), flush=True)
+sys.stdin.readline()
+bus.check(force=True)
+print(bus.generation('recipes'), len(dropped), flush=True)
+'''
+
+WRITER = '''
+from django.db import connection, transaction
+from api.invalidation import bus
+with transaction.atomic():
+    for _ in range(5):
+        bus.bump('recipes')
+'''
+
+
+class InvalidationAcrossProcessesTests(SimpleTestCase):
+    """Сброс кэша в одном процессе виден другому процессу через
+    таблицу поколений. Процессы работают с отдельной базой SQLite.
+    """
+
+    def run_manage(self, *args, **kwargs):
+        return subprocess.run(
+            [sys.executable, 'manage.py', *args], cwd=settings.BASE_DIR,
+            env=self.env, capture_output=True, text=True, timeout=120,
+            check=True, **kwargs)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.env = {**os.environ,
+                    'DB_ENGINE': 'django.db.backends.sqlite3',
+                    'DB_NAME': os.path.join(directory.name, 'db.sqlite3')}
+        self.run_manage('migrate', '--verbosity', '0')
+
+    def test_bump_reaches_other_process(self):
+        listener = subprocess.Popen(
+            [sys.executable, 'manage.py', 'shell', '-c', LISTENER],
+            cwd=settings.BASE_DIR, env=self.env, text=True,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            before = int(listener.stdout.readline())
+            self.run_manage('shell', '-c', WRITER)
+            output, _ = listener.communicate('\n', timeout=60)
+        finally:
+            listener.kill()
+        after, dropped = map(int, output.split())
+        self.assertEqual(after, before + 1)
+        self.assertEqual(dropped, 1)
+
+
+class UserEndpointQueriesTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(
+            email='viewer@example.com', username='viewer', password='x')
+        cls.authors = [
+            User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}', password='x')
+            for number in range(3)]
+        for author in cls.authors:
+            for number in range(3):
+                Recipe.objects.create(
+                    author=author, name=f'Рецепт {number}', text='...',
+                    cooking_time=10, image='images/recipe.png')
+        for author in cls.authors[:2]:
+            Subscription.objects.create(author=author, subscriber=cls.viewer)
+
+    def setUp(self):
+        self.client.force_authenticate(self.viewer)
+        bus.check(force=True)
+
+    def test_list(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/users/')
+        self.assertEqual(response.data['count'], 4)
+
+    def test_retrieve(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/users/{self.authors[0].pk}/')
+        self.assertTrue(response.data['is_subscribed'])
+
+    def test_me(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['id'], self.viewer.pk)
+
+    def test_subscriptions(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/users/subscriptions/?recipes_limit=2')
+        self.assertEqual(response.data['count'], 2)
+        for author in response.data['results']:
+            self.assertEqual(len(author['recipes']), 2)
+            self.assertEqual(author['recipes_count'], 3)
+
+    def test_subscribe(self):
+        # Автор, проверка и создание подписки (get_or_create
+        # в точке сохранения), затем автор с рецептами.
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                f'/api/users/{self.authors[2].pk}/subscribe/'
+                f'?recipes_limit=2')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['recipes']), 2)
+
+
+SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+SORT = re.compile(r'(^|->\s+)(Incremental )?Sort\b', re.M)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class QueryPlansTests(TestCase):
+    """Частые запросы API обслуживаются индексами. Планы строятся
+    с выключенными enable_seqscan и enable_sort, поэтому узел Seq Scan
+    или Sort в плане означает, что подходящего индекса нет.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            User(email=f'user{number}@example.com',
+                 username=f'user{number}', password='x')
+            for number in range(30))
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(200))
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {number}', text='...',
+                   cooking_time=10, image='images/recipe.png',
+                   score=number, popularity=number)
+            for author in users for number in range(10))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, amount=1,
+                             ingredient=ingredients[(index + shift) % 200])
+            for index, recipe in enumerate(recipes) for shift in range(5))
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipes[(index * 7 + shift) % 300])
+                for index, user in enumerate(users) for shift in range(10))
+        Subscription.objects.bulk_create(
+            Subscription(subscriber=user, author=users[(index + shift) % 30])
+            for index, user in enumerate(users) for shift in range(1, 6))
+        Recipe.objects.exclude(pk__in=[r.pk for r in recipes[:5]]).update(
+            score_updated=timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user, cls.recipe, cls.ingredient = (
+            users[0], recipes[0], ingredients[0])
+
+    def hot_queries(self):
+        """Возвращает пары (название, QuerySet) частых запросов API."""
+        user_id, recipe_id = self.user.pk, self.recipe.pk
+        return (
+            ('recipe feed', Recipe.objects.all()[:6]),
+            ('recipe feed with user flags',
+             annotate_user_flags(Recipe.objects.all(), self.user)[:6]),
+            ('trending feed',
+             Recipe.objects.order_by('-score', '-created')[:6]),
+            ('popular feed',
+             Recipe.objects.order_by('-popularity', '-created')[:6]),
+            ('recipes of author',
+             Recipe.objects.filter(author_id=user_id)[:6]),
+            ('recipe ingredients',
+             RecipeIngredient.objects.filter(recipe_id=recipe_id)),
+            ('recipes with ingredient',
+             RecipeIngredient.objects.filter(ingredient=self.ingredient)),
+            ('favorites of user', Favorite.objects.filter(user_id=user_id)),
+            ('favorites of recipe',
+             Favorite.objects.filter(recipe_id=recipe_id)),
+            ('shopping cart of user',
+             ShoppingCart.objects.filter(user_id=user_id)),
+            ('shopping cart of recipe',
+             ShoppingCart.objects.filter(recipe_id=recipe_id)),
+            ('subscriptions of user',
+             Subscription.objects.filter(subscriber_id=user_id)),
+            ('subscribers of author',
+             Subscription.objects.filter(author_id=user_id)),
+            ('ingredient catalog', Ingredient.objects.all()[:100]),
+            ('recipes to rescore',
+             Recipe.objects.filter(score_updated__isnull=True).values('pk')),
+        )
+
+    def test_hot_queries_use_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+        for name, queryset in self.hot_queries():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertEqual(SEQ_SCAN.findall(plan), [], plan)
+                self.assertIsNone(SORT.search(plan), plan)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class PartitioningTests(TransactionTestCase):
+    table = 'recipes_favorite'
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(email=f'user{number}@example.com',
+                                     username=f'user{number}', password='x')
+            for number in range(5)]
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.users[0], name=f'Рецепт {number}', text='...',
+                cooking_time=10, image='images/recipe.png')
+            for number in range(5)]
+        for user in self.users[:3]:
+            for recipe in self.recipes:
+                Favorite.objects.create(user=user, recipe=recipe)
+
+    def test_table_is_partitioned_without_losing_writes(self):
+        create_partitioned(self.table, 4)
+        start_sync(self.table)
+        # Изменения во время копирования повторяет триггер.
+        Favorite.objects.create(user=self.users[3], recipe=self.recipes[0])
+        Favorite.objects.filter(user=self.users[0]).delete()
+        # Строку, уже вставленную триггером, копирование пропускает.
+        self.assertEqual(backfill(self.table, chunk_size=4), 10)
+        Favorite.objects.create(user=self.users[4], recipe=self.recipes[1])
+        verify(self.table)
+        swap(self.table)
+        self.addCleanup(drop_unpartitioned, self.table)
+        self.assertTrue(is_partitioned(self.table))
+        self.assertEqual(relkind(f'{self.table}_unpartitioned'), 'r')
+        self.assertEqual(Favorite.objects.count(), 12)
+        favorite = Favorite.objects.create(
+            user=self.users[4], recipe=self.recipes[2])
+        self.assertGreater(favorite.pk, Favorite.objects.exclude(
+            pk=favorite.pk).order_by('-pk').first().pk)
+        # Внешние ключи старой таблицы не мешают удалять рецепты.
+        self.recipes[0].delete()
+        self.assertFalse(Favorite.objects.filter(
+            recipe_id=self.recipes[0].pk).exists())
+
+    def test_swap_refuses_incomplete_copy(self):
+        table = 'users_subscription'
+        Subscription.objects.create(
+            author=self.users[0], subscriber=self.users[1])
+        create_partitioned(table, 4)
+        self.addCleanup(drop_partitioned, table)
+        with self.assertRaises(PartitioningError):
+            swap(table)
+        self.assertFalse(is_partitioned(table))
@@ -0,0 +1,70 @@
+import time
+
+from rest_framework.throttling import ScopedRateThrottle
+
+from . import metrics
+
+LOCK_TIMEOUT = 1
+LOCK_ATTEMPTS = 20
+LOCK_DELAY = 0.005
+
+
+class TokenBucketThrottle(ScopedRateThrottle):
+    """Ограничение частоты запросов по алгоритму token bucket.
+    Область (scope) задается для каждого действия представления
+    в словаре `throttle_scopes`, например {'favorite': 'toggle'},
+    либо общим атрибутом `throttle_scope`. Скорость задается в
+    DEFAULT_THROTTLE_RATES в формате DRF: 'число/период'. Число запросов
+    является емкостью корзины, которая равномерно пополняется за период.
+    Корзина хранится в кэше Django и истекает через период, когда она
+    снова была бы полной. Чтение и запись корзины выполняются под
+    короткой блокировкой (cache.add), поэтому параллельные запросы
+    не тратят один и тот же токен. Лимит общий для процессов,
+    работающих с одним кэшем.
+    """
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scopes', {}).get(
+            getattr(view, 'action', None),
+            getattr(view, self.scope_attr, None))
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.refill = self.num_requests / self.duration
+        self.key = self.get_cache_key(request, view)
+        self.now = self.timer()
+        if not self.take():
+            metrics.incr(f'throttle.rejected.{self.scope}')
+            return False
+        metrics.incr(f'throttle.allowed.{self.scope}')
+        return True
+
+    def take(self) -> bool:
+        """Списывает токен из корзины, если он есть. Если блокировку
+        корзины не удалось получить, запрос отклоняется.
+        """
+        lock = f'{self.key}:lock'
+        for _ in range(LOCK_ATTEMPTS):
+            if self.cache.add(lock, True, LOCK_TIMEOUT):
+                break
+            time.sleep(LOCK_DELAY)
+        else:
+            self.tokens = 0
+            return False
+        try:
+            tokens, updated = self.cache.get(
+                self.key, (self.num_requests, self.now))
+            self.tokens = min(
+                self.num_requests,
+                tokens + (self.now - updated) * self.refill)
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            self.cache.set(self.key, (self.tokens, self.now), self.duration)
+            return True
+        finally:
+            self.cache.delete(lock)
+
+    def wait(self):
+        return max(0, (1 - self.tokens) / self.refill)
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .views import (IngredientViewSet, MetricsView, RecipeViewSet, TagViewSet,
+                    UserViewSet)
 
 router = DefaultRouter()
 
@@ -11,6 +12,7 @@ router.register('recipes', RecipeViewSet)
 router.register('users', UserViewSet)
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view()),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken'))
@@ -1,10 +1,13 @@
 from collections import defaultdict
 
+from django.db.models import Count, Exists, OuterRef, Prefetch, Value
 from django.shortcuts import get_object_or_404
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 
 from api.serializers import RecipeListSerializer
-from recipes.models import Recipe
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
 
 
 def create_shopping_list(queryset) -> list:
@@ -24,6 +27,95 @@ def create_shopping_list(queryset) -> list:
     return shopping_list
 
 
+def requested_fields(request, available, default=None) -> tuple:
+    """Возвращает поля ответа по параметрам запроса:
+    fields -- поля через запятую вместо полей по умолчанию default,
+    expand -- поля через запятую в дополнение к выбранным.
+    Допустимы поля из available, порядок полей -- как в available.
+    Поле id возвращается всегда.
+    """
+    def split(value):
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    params = request.query_params
+    if 'fields' in params:
+        selected = split(params['fields'])
+    else:
+        selected = set(available if default is None else default)
+    selected |= split(params.get('expand', '')) | {'id'}
+    unknown = selected - set(available)
+    if unknown:
+        raise ValidationError(
+            {'fields': f'Неизвестные поля: {", ".join(sorted(unknown))}.'})
+    return tuple(name for name in available if name in selected)
+
+
+def load_recipe_cards(queryset):
+    """Загружает для карточек рецептов (RecipeCardSerializer) только
+    нужные столбцы рецептов и авторов и теги, без ингредиентов.
+    """
+    return queryset.select_related('author').prefetch_related('tags').only(
+        'name', 'image', 'cooking_time', 'updated', 'author__email',
+        'author__username', 'author__first_name', 'author__last_name')
+
+
+def annotate_user_flags(queryset, user, fields=None):
+    """Добавляет к QuerySet рецептов флаги текущего пользователя:
+    is_favorited, is_in_shopping_cart и is_subscribed (подписка на автора).
+    Для анонимного пользователя все флаги равны False. Если переданы
+    поля ответа fields, флаги, которых нет в ответе, не вычисляются
+    и тоже равны False.
+    """
+    if user.is_anonymous:
+        return queryset.annotate(
+            is_favorited=Value(False),
+            is_in_shopping_cart=Value(False),
+            is_subscribed=Value(False),
+        )
+    flags = {
+        'is_favorited': Exists(Favorite.objects.filter(
+            recipe=OuterRef('pk'), user=user)),
+        'is_in_shopping_cart': Exists(ShoppingCart.objects.filter(
+            recipe=OuterRef('pk'), user=user)),
+        'is_subscribed': Exists(Subscription.objects.filter(
+            author=OuterRef('author'), subscriber=user)),
+    }
+    if fields is not None:
+        skipped = {'is_favorited', 'is_in_shopping_cart'} - set(fields)
+        if 'author' not in fields:
+            skipped.add('is_subscribed')
+        flags.update((name, Value(False)) for name in skipped)
+    return queryset.annotate(**flags)
+
+
+def annotate_subscribed(queryset, user):
+    """Добавляет к QuerySet пользователей признак is_subscribed:
+    подписан ли на них текущий пользователь.
+    """
+    if user.is_anonymous:
+        return queryset.annotate(is_subscribed=Value(False))
+    return queryset.annotate(is_subscribed=Exists(Subscription.objects.filter(
+        author=OuterRef('pk'), subscriber=user)))
+
+
+def with_recipes(queryset, limit=None, recipes=True, count=True):
+    """Добавляет к QuerySet авторов количество рецептов recipes_count
+    (если count) и первые limit рецептов каждого автора в атрибуте
+    limited_recipes (если recipes).
+    Рецепты всех авторов загружаются одним запросом.
+    """
+    if count:
+        queryset = queryset.annotate(recipes_count=Count('recipes'))
+    if not recipes:
+        return queryset
+    limited = Recipe.objects.only('name', 'image', 'cooking_time', 'author')
+    if limit:
+        limited = limited.filter(pk__in=Recipe.objects.filter(
+            author=OuterRef('author')).values('pk')[:limit])
+    return queryset.prefetch_related(
+        Prefetch('recipes', queryset=limited, to_attr='limited_recipes'))
+
+
 def add_obj(request, pk, model):
     """Вспомогательная функция для RecipeViewSet.
     Создает связь между рецептом и пользователем через модель.
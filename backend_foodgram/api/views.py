@@ -1,22 +1,44 @@
+import time
+from concurrent.futures import TimeoutError
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404 as get_or_404
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+from recipes.catalog import export_recipes, import_recipes
+from recipes.changes import CursorExpiredError, changes_since
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeChange,
                             ShoppingCart, Tag)
+from recipes.similarity import similar_recipes
 from users.models import Subscription
+
+from . import metrics
+from .cache import (catalog_key, get_catalog, get_recipe_fragments,
+                    personalize_recipe, recipe_etag)
+from .coalesce import single_flight
+from .compression import shared
+from .exports import artifact_name, storage, submit_shopping_list, user_cart
 from .filters import RecipeFilter
+from .invalidation import bus
 from .permissions import OwnerOrReadOnly, ReadOnly
-from .serializers import (IngredientSerializer, RecipeSerializer,
-                          SubscriptionSerializer, TagSerializer)
-from .utils import add_obj, create_shopping_list, del_obj
+from .serializers import (RECIPE_CARD_FIELDS, RECIPE_FIELDS,
+                          IngredientSerializer, RecipeListSerializer,
+                          RecipeSerializer, SubscriptionSerializer,
+                          TagSerializer, UserSerializer)
+from .utils import (add_obj, annotate_subscribed, annotate_user_flags, del_obj,
+                    load_recipe_cards, requested_fields, with_recipes)
 
 User = get_user_model()
 
@@ -33,18 +55,43 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     filter_backends = (filters.SearchFilter,)
     search_fields = ('^name',)
+    throttle_scope = 'ingredients'
+
+    def list(self, request, *args, **kwargs):
+        """Весь справочник отдается из кэша.
+        Одинаковые одновременные запросы поиска выполняются один раз.
+        """
+        search = request.query_params.get('name', '').lower()
+        if not search:
+            key = catalog_key('ingredients')
+            return shared(
+                Response(get_catalog('ingredients', self.catalog)), key)
+        key = f'ingredients:{bus.generation("catalog:ingredients")}:{search}'
+        data = single_flight(key, lambda: list(self.get_serializer(
+            self.filter_queryset(self.get_queryset()), many=True).data))
+        return shared(Response(data), key)
+
+    def catalog(self):
+        return list(self.get_serializer(self.get_queryset(), many=True).data)
 
 
 class TagViewSet(viewsets.ModelViewSet):
     """
     retrieve: Возвращает запрашиваемый тег.
-    list: Возвращает все теги.
+    list: Возвращает все теги из кэша справочников.
     """
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (ReadOnly,)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        key = catalog_key('tags')
+        return shared(Response(get_catalog('tags', self.catalog)), key)
+
+    def catalog(self):
+        return list(self.get_serializer(self.get_queryset(), many=True).data)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """
@@ -64,18 +111,137 @@ class RecipeViewSet(viewsets.ModelViewSet):
              - tags,
              - is_favorite,
              - is_in_shopping_cart
+    fields, expand: Поля ответа через запятую вместо полей по умолчанию
+                    и в дополнение к ним. Список по умолчанию
+                    возвращает карточки рецептов без text и ingredients.
     """
-    queryset = Recipe.objects.prefetch_related(
-        'author', 'tags', 'ingredients').all()
+    queryset = Recipe.objects.select_related('author').prefetch_related(
+        'tags', 'recipeingredient_set__ingredient')
     serializer_class = RecipeSerializer
     permission_classes = (OwnerOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     pagination_class = PageNumberPagination
+    throttle_scopes = {
+        'favorite': 'toggle',
+        'shopping_cart': 'toggle',
+    }
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def _load_recipes(self, ids):
+        return self.get_queryset().filter(pk__in=ids)
+
+    def _load_cards(self, ids):
+        return load_recipe_cards(Recipe.objects.filter(pk__in=ids))
+
+    def _response_fields(self, request):
+        """Поля ответа по параметрам fields и expand.
+        Список по умолчанию возвращает карточки рецептов.
+        """
+        default = RECIPE_CARD_FIELDS if self.action == 'list' else None
+        return requested_fields(request, RECIPE_FIELDS, default)
+
+    def _fragments(self, versions, fields):
+        """Возвращает карточки рецептов, если все поля ответа есть
+        в карточке, иначе полные фрагменты рецептов.
+        """
+        if set(fields) <= set(RECIPE_CARD_FIELDS):
+            return get_recipe_fragments(versions, self._load_cards, card=True)
+        return get_recipe_fragments(versions, self._load_recipes)
+
+    def _personalized_recipes(self, request, ids):
+        """Возвращает рецепты с флагами текущего пользователя
+        в виде словаря {id: рецепт}. Флаги и версии читаются одним
+        запросом, рецепты берутся из кэша фрагментов.
+        Отсутствующие рецепты в словарь не попадают.
+        """
+        fields = self._response_fields(request)
+        rows = annotate_user_flags(
+            Recipe.objects.filter(pk__in=ids), request.user, fields
+        ).values_list('pk', 'updated', 'is_favorited',
+                      'is_in_shopping_cart', 'is_subscribed')
+        flags = {pk: (updated, rest) for pk, updated, *rest in rows}
+        fragments = self._fragments(
+            {pk: updated for pk, (updated, _) in flags.items()}, fields)
+        return {
+            pk: personalize_recipe(
+                fragment, request, *flags[pk][1], fields=fields)
+            for pk, fragment in fragments.items()
+        }
+
+    def list(self, request, *args, **kwargs):
+        """Возвращает страницу рецептов.
+        Одинаковые одновременные запросы анонимных пользователей
+        выполняются один раз.
+        """
+        fields = self._response_fields(request)
+        if request.user.is_anonymous:
+            key = (f'recipes:{bus.generation("recipes")}:'
+                   f'{request.build_absolute_uri()}')
+            return shared(Response(single_flight(
+                key, lambda: self._list_data(request, fields))), key)
+        return Response(self._list_data(request, fields))
+
+    def _list_data(self, request, fields):
+        """Собирает данные страницы рецептов.
+        Запрос страницы выбирает только id, версии рецептов и нужные
+        флаги пользователя, сами рецепты берутся из кэша фрагментов.
+        """
+        queryset = annotate_user_flags(
+            self.filter_queryset(Recipe.objects.all()), request.user, fields
+        ).values_list('pk', 'updated', 'is_favorited',
+                      'is_in_shopping_cart', 'is_subscribed')
+        page = self.paginate_queryset(queryset)
+        rows = queryset if page is None else page
+        recipes = self._fragments(
+            {pk: updated for pk, updated, *_ in rows}, fields)
+        data = [personalize_recipe(recipes[pk], request, *flags,
+                                   fields=fields)
+                for pk, _, *flags in rows if pk in recipes]
+        if page is None:
+            return data
+        return self.get_paginated_response(data).data
+
+    def retrieve(self, request, *args, **kwargs):
+        """Возвращает рецепт с поддержкой условных запросов.
+        Версия рецепта и флаги пользователя читаются одним запросом,
+        при совпадении If-None-Match возвращается ответ 304.
+        Last-Modified (с точностью до секунды) отдается анонимным
+        пользователям, только когда секунда версии уже прошла: иначе
+        следующая правка в ту же секунду получила бы ту же дату.
+        При наличии If-None-Match заголовок If-Modified-Since
+        не учитывается.
+        Тело ответа собирается из кэша фрагментов рецептов, сжатые
+        варианты ответов анонимным пользователям кэшируются.
+        """
+        pk = kwargs[self.lookup_field]
+        fields = self._response_fields(request)
+        updated, *flags = get_or_404(
+            annotate_user_flags(Recipe.objects.all(), request.user, fields)
+            .values_list('updated', 'is_favorited',
+                         'is_in_shopping_cart', 'is_subscribed'),
+            pk=pk)
+        etag = recipe_etag(pk, updated, flags)
+        last_modified = int(updated.timestamp())
+        if request.user.is_authenticated or time.time() < last_modified + 1:
+            last_modified = None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            fragment, = self._fragments({int(pk): updated}, fields).values()
+            response = Response(personalize_recipe(
+                fragment, request, *flags, fields=fields))
+            if request.user.is_anonymous:
+                shared(response, f'{etag}:{request.build_absolute_uri()}')
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
     @action(methods=['post', 'delete'], detail=True)
     def favorite(self, request, pk):
         """Добавляет/удаляет рецепт из Избранного текущего пользователя."""
@@ -94,17 +260,163 @@ class RecipeViewSet(viewsets.ModelViewSet):
         data, status = del_obj(request, pk, ShoppingCart)
         return Response(data, status=status)
 
+    @action(methods=['get'], detail=False)
+    def changes(self, request):
+        """Возвращает изменения рецептов после курсора since.
+        Для каждого рецепта в пачке возвращается только последнее
+        изменение: рецепт целиком или запись об удалении.
+        Размер пачки задается параметром limit. Если курсор старше
+        границы сжатия журнала, возвращается ответ 410 и клиент должен
+        начать синхронизацию заново с since=0.
+        """
+        try:
+            cursor = max(0, int(request.query_params.get('since', 0)))
+            limit = int(request.query_params.get(
+                'limit', settings.CHANGES_PAGE_SIZE))
+        except ValueError:
+            return Response({'detail': 'Параметры since и limit должны '
+                                       'быть целыми числами.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.CHANGES_MAX_PAGE_SIZE))
+        try:
+            events, next_cursor, has_more = changes_since(cursor, limit)
+        except CursorExpiredError:
+            return Response({'detail': 'Курсор устарел, требуется полная '
+                                       'синхронизация.'},
+                            status=status.HTTP_410_GONE)
+        recipes = self._personalized_recipes(
+            request, [pk for pk, kind in events
+                      if kind != RecipeChange.DELETED])
+        changes = []
+        for pk, kind in events:
+            if pk in recipes:
+                changes.append(
+                    {'id': pk, 'deleted': False, 'recipe': recipes[pk]})
+            elif kind == RecipeChange.DELETED:
+                changes.append({'id': pk, 'deleted': True})
+        return Response({'cursor': next_cursor, 'has_more': has_more,
+                         'changes': changes})
+
+    @action(methods=['get', 'post'], detail=False,
+            permission_classes=[AllowAny])
+    def batch(self, request):
+        """Возвращает несколько рецептов за один запрос.
+        id передаются параметром ids=1,2,3 или в теле POST-запроса
+        {"ids": [1, 2, 3]}, не больше RECIPE_BATCH_LIMIT.
+        Рецепты возвращаются в порядке запроса, id отсутствующих
+        рецептов -- в поле missing.
+        """
+        if request.method == 'POST':
+            ids = request.data.get('ids')
+            if not isinstance(ids, list):
+                ids = None
+        else:
+            ids = request.query_params.get('ids', '').split(',')
+        try:
+            ids = list(dict.fromkeys(
+                int(pk) for pk in ids if str(pk).strip()))
+        except (TypeError, ValueError):
+            return Response({'detail': 'Передайте список целых id рецептов '
+                                       'в параметре ids.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.RECIPE_BATCH_LIMIT:
+            return Response({'detail': 'Можно запросить не больше '
+                                       f'{settings.RECIPE_BATCH_LIMIT} '
+                                       'рецептов.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        recipes = self._personalized_recipes(request, ids)
+        return Response({
+            'results': [recipes[pk] for pk in ids if pk in recipes],
+            'missing': [pk for pk in ids if pk not in recipes],
+        })
+
+    @action(methods=['get'], detail=True)
+    def similar(self, request, pk):
+        """Возвращает рецепты, похожие по ингредиентам и тегам.
+        Количество задается параметром limit (не больше 50).
+        """
+        recipe = get_or_404(Recipe, pk=pk)
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.SIMILAR_RECIPES_LIMIT))
+        except ValueError:
+            limit = settings.SIMILAR_RECIPES_LIMIT
+        limit = max(1, min(limit, 50))
+        ranked = [recipe_id for recipe_id, _ in similar_recipes(
+            recipe, limit)]
+        recipes = Recipe.objects.in_bulk(ranked)
+        serializer = RecipeListSerializer(
+            [recipes[pk] for pk in ranked if pk in recipes],
+            many=True, context={'request': request})
+        return Response(serializer.data)
+
+    @action(methods=['get'], detail=False,
+            permission_classes=[IsAdminUser])
+    def export(self, request):
+        """Выгружает рецепты в формате NDJSON потоком.
+        Доступны те же фильтры, что и у списка рецептов.
+        Доступ только администратору.
+        """
+        response = StreamingHttpResponse(
+            export_recipes(self.filter_queryset(Recipe.objects.all())),
+            content_type='application/x-ndjson')
+        response['Content-Disposition'] = (
+            'attachment; filename=recipes.ndjson')
+        return response
+
+    @action(methods=['post'], detail=False, url_path='import',
+            permission_classes=[IsAdminUser])
+    def import_recipes(self, request):
+        """Загружает рецепты из тела запроса в формате NDJSON.
+        Авторы рецептов ищутся по email, ингредиенты -- по названию
+        и единице измерения, теги -- по slug. Возвращает количество
+        созданных и пропущенных рецептов и ошибки по номерам строк.
+        Загрузка выполняется в запросе, поэтому размер тела ограничен
+        RECIPE_IMPORT_MAX_SIZE байт; большие файлы загружаются
+        командой import_recipes. Доступ только администратору.
+        """
+        size = int(request.META.get('CONTENT_LENGTH') or 0)
+        if size > settings.RECIPE_IMPORT_MAX_SIZE:
+            return Response(
+                {'detail': 'Файл слишком большой, загрузите его '
+                           'командой import_recipes.'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        stream = request.stream
+        result = import_recipes(stream if stream is not None else [])
+        return Response(
+            result.as_dict(),
+            status=(status.HTTP_201_CREATED if result.created
+                    else status.HTTP_200_OK))
+
     @action(methods=['get'], detail=False,
             permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
-        """Возвращает список покупок текущего пользователя в формате txt."""
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user).values(
-                'ingredient__name',
-                'ingredient__measurement_unit',
-                'amount').order_by('ingredient__name')
-        shopping_list = create_shopping_list(ingredients)
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        """Возвращает список покупок текущего пользователя в формате txt.
+        Список хранится в хранилище по хешу корзины: если файл для
+        текущей корзины уже есть, он отдается сразу. Иначе список
+        формируется в фоне; если он не успел сформироваться за
+        SHOPPING_LIST_EXPORT_WAIT секунд, возвращается ответ 202.
+        """
+        name = artifact_name(user_cart(request.user.pk))
+        if storage.exists(name):
+            metrics.incr('shopping_list.stored')
+        else:
+            future = submit_shopping_list(request.user.pk, name)
+            try:
+                name = future.result(
+                    timeout=settings.SHOPPING_LIST_EXPORT_WAIT)
+            except TimeoutError:
+                return Response(
+                    {'detail': 'Список покупок формируется, '
+                               'повторите запрос позже.'},
+                    status=status.HTTP_202_ACCEPTED,
+                    headers={'Retry-After': '2'})
+        if settings.SHOPPING_LIST_ACCEL_REDIRECT:
+            response = HttpResponse(content_type='text/plain')
+            response['X-Accel-Redirect'] = storage.url(name)
+        else:
+            response = FileResponse(
+                storage.open(name, 'rb'), content_type='text/plain')
         response['Content-Disposition'] = (
             'attachment; filename={0}'.format('shopping_list.txt')
         )
@@ -112,8 +424,72 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
 
 class UserViewSet(DjoserUserViewSet):
-    serializer_class = SubscriptionSerializer
+    """
+    list, retrieve, me: Пользователи с признаком подписки.
+    subscribe, subscriptions: Авторы с признаком подписки, рецептами
+                              и количеством рецептов.
+                              Количество рецептов ограничивается
+                              параметром recipes_limit.
+    fields, expand: Поля ответа через запятую вместо полей по умолчанию
+                    и в дополнение к ним. В list и retrieve можно
+                    запросить поля подписок recipes и recipes_count.
+    """
+    serializer_class = UserSerializer
     pagination_class = PageNumberPagination
+    throttle_scopes = {
+        'subscribe': 'subscribe',
+        'delete_subscribe': 'subscribe',
+    }
+    subscription_actions = ('subscribe', 'subscriptions')
+    fieldset_actions = ('list', 'retrieve', *subscription_actions)
+    user_columns = ('email', 'username', 'first_name', 'last_name')
+
+    def recipes_limit(self):
+        try:
+            return max(0, int(self.request.query_params.get(
+                'recipes_limit', 0)))
+        except ValueError:
+            return 0
+
+    def response_fields(self):
+        """Поля ответа по параметрам fields и expand или None для
+        действий без выбора полей.
+        """
+        if self.action not in self.fieldset_actions:
+            return None
+        default = (SubscriptionSerializer
+                   if self.action in self.subscription_actions
+                   else UserSerializer).Meta.fields
+        return requested_fields(
+            self.request, SubscriptionSerializer.Meta.fields, default)
+
+    def get_serializer_class(self):
+        fields = self.response_fields() or ()
+        if (self.action in self.subscription_actions
+                or {'recipes', 'recipes_count'} & set(fields)):
+            return SubscriptionSerializer
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(),
+                'recipes_limit': self.recipes_limit(),
+                'fields': self.response_fields()}
+
+    def get_queryset(self):
+        """Загружает только столбцы и аннотации для полей ответа."""
+        queryset = super().get_queryset()
+        fields = self.response_fields()
+        if fields is None:
+            return queryset
+        queryset = queryset.only(
+            *(name for name in self.user_columns if name in fields))
+        if 'is_subscribed' in fields:
+            queryset = annotate_subscribed(queryset, self.request.user)
+        if 'recipes' in fields or 'recipes_count' in fields:
+            queryset = with_recipes(
+                queryset, self.recipes_limit(),
+                recipes='recipes' in fields, count='recipes_count' in fields)
+        return queryset
 
     @action(methods=['post'], detail=True,
             permission_classes=[IsAuthenticated])
@@ -130,8 +506,7 @@ class UserViewSet(DjoserUserViewSet):
             return Response(
                 {"errors": "Вы уже подписаны на этого автора."},
                 status=status.HTTP_400_BAD_REQUEST)
-        serializer = self.get_serializer(
-            author, context={'request': request})
+        serializer = self.get_serializer(self.get_queryset().get(pk=id))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
@@ -148,12 +523,19 @@ class UserViewSet(DjoserUserViewSet):
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         """Возвращает список авторов, на которых подписан пользователь."""
-        authors = User.objects.filter(subscription__subscriber=request.user)
+        authors = self.get_queryset().filter(
+            subscription__subscriber=request.user).order_by('pk')
         page = self.paginate_queryset(authors)
         if page is not None:
-            serializer = self.get_serializer(
-                page, many=True, context={'request': request})
+            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(
-            authors, many=True, context={'request': request})
+        serializer = self.get_serializer(authors, many=True)
         return Response(serializer.data)
+
+
+class MetricsView(APIView):
+    """Возвращает счетчики текущего процесса. Доступ только админам."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(metrics.snapshot())
@@ -0,0 +1,91 @@
+"""Прогрев процесса перед обработкой запросов.
+
+Все, что Django и DRF строят лениво на первых запросах, строится
+заранее: маршруты URL, каталоги переводов, кэши _meta моделей, поля
+сериализаторов, справочники тегов и ингредиентов, индекс похожих
+рецептов. Вызывается в мастер-процессе gunicorn (preload_app), поэтому
+рабочие процессы получают уже прогретую память при fork.
+Поколения кэшей читаются до заполнения кэшей, чтобы рабочие процессы
+не сбросили прогретые кэши при первой проверке.
+"""
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver, resolve, reverse
+from django.utils import translation
+from rest_framework.serializers import Serializer
+
+from recipes.models import Ingredient, Tag
+from recipes.similarity import get_index
+
+from . import serializers
+from .cache import get_catalog
+from .invalidation import bus
+
+
+def warm_urls():
+    get_resolver().reverse_dict
+    resolve(reverse('recipe-list'))
+
+
+def warm_translations():
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.gettext('This field is required.')
+
+
+def warm_models():
+    for model in apps.get_models():
+        model._meta.get_fields()
+        model._meta._forward_fields_map
+
+
+def warm_serializers():
+    """Строит поля всех сериализаторов api: для ModelSerializer это
+    разбор полей модели и построение полей по ним.
+    """
+    for serializer_class in vars(serializers).values():
+        if (isinstance(serializer_class, type)
+                and issubclass(serializer_class, Serializer)
+                and serializer_class.__module__ == serializers.__name__):
+            serializer_class(context={'request': None}).fields
+
+
+def warm_catalogs():
+    get_catalog('tags', lambda: list(serializers.TagSerializer(
+        Tag.objects.all(), many=True).data))
+    get_catalog('ingredients', lambda: list(serializers.IngredientSerializer(
+        Ingredient.objects.all(), many=True).data))
+
+
+def warm_similarity_index():
+    get_index()
+
+
+STEPS = (
+    ('cache generations', lambda: bus.check(force=True)),
+    ('urls', warm_urls),
+    ('translations', warm_translations),
+    ('models', warm_models),
+    ('serializers', warm_serializers),
+    ('catalogs', warm_catalogs),
+    ('similarity index', warm_similarity_index),
+)
+
+
+def warm_up():
+    """Выполняет все шаги прогрева.
+    Возвращает список пар (шаг, время в секундах).
+    Соединения с БД закрываются: процесс может быть разветвлен (fork),
+    и дочерние процессы не должны использовать общее соединение.
+    """
+    timings = []
+    try:
+        for name, step in STEPS:
+            started = time.perf_counter()
+            step()
+            timings.append((name, time.perf_counter() - started))
+    finally:
+        connections.close_all()
+    return timings
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 
 from dotenv import find_dotenv, load_dotenv
 
@@ -38,6 +39,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.InvalidationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -84,6 +88,22 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('FRAGMENT_CACHE_SIZE', default=10000)),
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -115,6 +135,44 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+TOKEN_LOCAL_CACHE_TTL = int(os.getenv('TOKEN_LOCAL_CACHE_TTL', default=5))
+TOKEN_LOCAL_CACHE_SIZE = 10000
+
+COALESCE_TTL = float(os.getenv('COALESCE_TTL', default=1))
+CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', default=300))
+INVALIDATION_CHECK_INTERVAL = float(os.getenv('INVALIDATION_CHECK_INTERVAL', default=1))
+
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', default=1024))
+
+SHOPPING_LIST_EXPORT_WORKERS = int(os.getenv('SHOPPING_LIST_EXPORT_WORKERS', default=2))
+SHOPPING_LIST_EXPORT_WAIT = float(os.getenv('SHOPPING_LIST_EXPORT_WAIT', default=2))
+SHOPPING_LIST_ROOT = os.getenv('SHOPPING_LIST_ROOT', default=os.path.join(BASE_DIR, 'shopping_lists'))
+SHOPPING_LIST_ACCEL_REDIRECT = os.getenv('SHOPPING_LIST_ACCEL_REDIRECT', default='False') == 'True'
+SHOPPING_LIST_ACCEL_URL = '/protected/shopping_lists/'
+
+SIMILARITY_INDEX_DIR = os.getenv('SIMILARITY_INDEX_DIR', default=os.path.join(BASE_DIR, 'similarity_index'))
+SIMILAR_RECIPES_LIMIT = 6
+RECIPE_BATCH_LIMIT = 100
+RECIPE_IMPORT_MAX_SIZE = int(os.getenv('RECIPE_IMPORT_MAX_SIZE', default=10 * 1024 * 1024))
+
+TRENDING_HALF_LIFE = timedelta(days=float(os.getenv('TRENDING_HALF_LIFE_DAYS', default=3)))
+TRENDING_WEIGHTS = {'favorite': 1.0, 'shoppingcart': 2.0}
+TRENDING_SAFETY_LAG = timedelta(seconds=float(os.getenv('TRENDING_SAFETY_LAG_SECONDS', default=60)))
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', default=os.path.join(BASE_DIR, 'profiles'))
+PROFILE_HEADER_SECRET = os.getenv('PROFILE_HEADER_SECRET', default='')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', default=0))
+PROFILE_THRESHOLD_MS = float(os.getenv('PROFILE_THRESHOLD_MS', default=0))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', default=5))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', default=200))
+
+CHANGES_PAGE_SIZE = 100
+CHANGES_MAX_PAGE_SIZE = 1000
+CHANGES_TOMBSTONE_TTL = timedelta(days=float(os.getenv('CHANGES_TOMBSTONE_TTL_DAYS', default=30)))
+CHANGES_SAFETY_LAG = timedelta(seconds=float(os.getenv('CHANGES_SAFETY_LAG_SECONDS', default=5)))
+
+USER_TABLE_PARTITIONS = int(os.getenv('USER_TABLE_PARTITIONS', default=0))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 REST_FRAMEWORK = {
@@ -122,11 +180,28 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'api.throttles.TokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'ingredients': os.getenv('THROTTLE_INGREDIENTS', default='120/min'),
+        'toggle': os.getenv('THROTTLE_TOGGLE', default='60/min'),
+        'subscribe': os.getenv('THROTTLE_SUBSCRIBE', default='30/min'),
+    },
     'DEFAULT_PAGINATION_CLASS': None,
     'PAGE_SIZE': 6,
     'SEARCH_PARAM': 'name'
@@ -135,6 +210,7 @@ REST_FRAMEWORK = {
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
+    'LOGOUT_ON_PASSWORD_CHANGE': True,
     'SERIALIZERS': {
         'user': 'api.serializers.UserSerializer',
         'current_user': 'api.serializers.UserSerializer',
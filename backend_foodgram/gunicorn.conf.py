@@ -0,0 +1,34 @@
+"""Настройки gunicorn.
+
+Приложение загружается и прогревается в мастер-процессе до запуска
+рабочих процессов (preload_app), рабочие процессы получают прогретую
+память через fork.
+"""
+import time
+
+started = time.monotonic()
+
+wsgi_app = 'backend_foodgram.wsgi:application'
+bind = '0:8000'
+preload_app = True
+
+
+def when_ready(server):
+    from api.warmup import warm_up
+
+    # Ошибка в when_ready останавливает мастер, а база может быть еще
+    # недоступна или не мигрирована: тогда процессы стартуют с холодными
+    # кэшами.
+    try:
+        timings = warm_up()
+    except Exception:
+        server.log.warning('Warm-up failed, starting cold', exc_info=True)
+    else:
+        server.log.info('Warm-up: %s', ', '.join(
+            f'{name} {seconds * 1000:.1f} ms' for name, seconds in timings))
+    server.log.info('Boot to ready: %.2f s', time.monotonic() - started)
+
+
+def post_worker_init(worker):
+    worker.log.info('Worker %s ready in %.2f s after master start',
+                    worker.pid, time.monotonic() - started)
@@ -1,29 +1,55 @@
 from django.contrib import admin
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                      ShoppingCart, Tag)
+from .pagination import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Базовые настройки админки для больших таблиц:
+    примерное количество строк и без полного COUNT(*) при поиске.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
+    autocomplete_fields = ('ingredient',)
     min_num = 1
     extra = 1
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdmin):
     list_display = ('name', 'author', 'added_to_favorites')
-    list_filter = ('tags', 'name', 'author')
-    search_fields = ('name', 'author__username', 'tags__slug', 'tags__name')
+    list_select_related = ('author',)
+    list_filter = ('tags',)
+    search_fields = ('^name', '=author__username', '=tags__slug')
+    autocomplete_fields = ('author',)
     filter_horizontal = ('tags',)
     inlines = (RecipeIngredientInline,)
 
-    @admin.display(description='Добавления в избранное')
+    def get_queryset(self, request):
+        """Количество добавлений в Избранное считается подзапросом
+        только для строк текущей страницы.
+        """
+        favorites = Favorite.objects.filter(
+            recipe=OuterRef('pk')).order_by().values('recipe').annotate(
+                count=Count('pk')).values('count')
+        return super().get_queryset(request).annotate(
+            favorites_count=Coalesce(
+                Subquery(favorites, output_field=IntegerField()), 0))
+
+    @admin.display(description='Добавления в избранное',
+                   ordering='favorites_count')
     def added_to_favorites(self, obj: Recipe):
         """Вычисляемое поле для админ панели.
         Вовзращает количество добавлений рецепта в Избранное.
         """
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 @admin.register(Tag)
@@ -35,24 +61,29 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdmin):
     list_display = ('name', 'measurement_unit')
     list_editable = ('measurement_unit',)
-    list_filter = ('name',)
-    search_fields = ('name',)
+    search_fields = ('^name',)
 
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(LargeTableAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
     list_editable = ('amount',)
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     list_display = ('id', 'recipe', 'user')
+    list_select_related = ('recipe', 'user')
+    autocomplete_fields = ('recipe', 'user')
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(LargeTableAdmin):
     list_display = ('id', 'recipe', 'user')
+    list_select_related = ('recipe', 'user')
+    autocomplete_fields = ('recipe', 'user')
@@ -0,0 +1,225 @@
+"""Выгрузка и загрузка каталога рецептов в формате NDJSON.
+
+Каждая строка -- JSON одного рецепта:
+    {"id": 1, "name": "...", "text": "...", "cooking_time": 10,
+     "image": "images/...", "author": "email автора",
+     "created": "...", "updated": "...", "tags": ["slug", ...],
+     "ingredients": [{"name": "...", "measurement_unit": "...",
+                      "amount": 1}, ...]}
+Выгрузка читает рецепты серверным курсором (iterator) и подгружает
+теги и ингредиенты пачками, поэтому расход памяти не зависит от размера
+каталога. Загрузка создает рецепты через bulk_create в отдельной
+транзакции на каждую пачку строк. bulk_create не отправляет сигналы
+моделей, поэтому журнал изменений и счетчики ссылок на картинки
+обновляются явно, а о созданных рецептах сообщает сигнал
+recipes_imported.
+"""
+import orjson
+from django.contrib.auth import get_user_model
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .models import (ImageBlob, Ingredient, Recipe, RecipeChange,
+                     RecipeIngredient, Tag)
+from .signals import recipes_imported
+
+User = get_user_model()
+
+CHUNK_SIZE = 500
+
+
+def recipe_record(recipe) -> dict:
+    """Возвращает словарь рецепта для выгрузки."""
+    return {
+        'id': recipe.pk,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': recipe.image.name,
+        'author': recipe.author.email,
+        'created': recipe.created,
+        'updated': recipe.updated,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {'name': item.ingredient.name,
+             'measurement_unit': item.ingredient.measurement_unit,
+             'amount': item.amount}
+            for item in recipe.recipeingredient_set.all()
+        ],
+    }
+
+
+def export_recipes(queryset=None, chunk_size=CHUNK_SIZE):
+    """Генератор строк NDJSON (bytes) с рецептами queryset."""
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    queryset = queryset.order_by('pk').select_related('author').only(
+        'name', 'text', 'cooking_time', 'image', 'created', 'updated',
+        'author__email',
+    ).prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.only('slug')),
+        Prefetch('recipeingredient_set',
+                 queryset=RecipeIngredient.objects.select_related(
+                     'ingredient').order_by('pk')),
+    )
+    for recipe in queryset.iterator(chunk_size=chunk_size):
+        yield orjson.dumps(recipe_record(recipe),
+                           option=orjson.OPT_APPEND_NEWLINE)
+
+
+class ImportResult:
+    """Итог загрузки: количество созданных и пропущенных рецептов
+    и ошибки в виде списка (номер строки, сообщение).
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+
+    def as_dict(self) -> dict:
+        return {
+            'created': self.created,
+            'skipped': self.skipped,
+            'errors': [{'line': line, 'error': error}
+                       for line, error in self.errors],
+        }
+
+
+class RecipeImporter:
+    """Загружает рецепты из строк NDJSON пачками по chunk_size.
+    Рецепты, уже существующие у автора (по названию), пропускаются.
+    Если передан author, все рецепты создаются от его имени.
+    """
+
+    def __init__(self, author=None, chunk_size=CHUNK_SIZE):
+        self.author = author
+        self.chunk_size = chunk_size
+        self.result = ImportResult()
+        self.ingredients = {
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.values_list('pk', 'name', 'measurement_unit')
+        }
+        self.tags = dict(Tag.objects.values_list('slug', 'pk'))
+        self.authors = {}
+        self.images = {}
+
+    def run(self, lines) -> ImportResult:
+        chunk = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                chunk.append(self.parse(line))
+            except (ValueError, TypeError, KeyError) as error:
+                self.result.errors.append((number, self.message(error)))
+                continue
+            if len(chunk) >= self.chunk_size:
+                self.save(chunk)
+                chunk = []
+        if chunk:
+            self.save(chunk)
+        return self.result
+
+    @staticmethod
+    def message(error):
+        if isinstance(error, KeyError):
+            return f'Отсутствует поле {error}.'
+        return str(error)
+
+    def get_author_id(self, email):
+        if self.author is not None:
+            return self.author.pk
+        if email not in self.authors:
+            self.authors[email] = User.objects.filter(
+                email=email).values_list('pk', flat=True).first()
+        if self.authors[email] is None:
+            raise ValueError(f'Автор {email} не найден.')
+        return self.authors[email]
+
+    def check_image(self, name):
+        """Проверяет, что файл картинки есть в хранилище картинок."""
+        if name not in self.images:
+            try:
+                self.images[name] = Recipe.image.field.storage.exists(name)
+            except SuspiciousFileOperation:
+                self.images[name] = False
+        if not self.images[name]:
+            raise ValueError(f'Картинка {name} не найдена.')
+
+    def parse(self, line):
+        """Проверяет строку и возвращает (рецепт, ингредиенты, теги)."""
+        data = orjson.loads(line)
+        cooking_time = int(data['cooking_time'])
+        if cooking_time < 1:
+            raise ValueError('Время приготовления должно быть больше 1 '
+                             'минуты.')
+        name = str(data['name'])
+        max_length = Recipe._meta.get_field('name').max_length
+        if len(name) > max_length:
+            raise ValueError(
+                f'Название длиннее {max_length} символов.')
+        image = str(data['image'])
+        self.check_image(image)
+        recipe = Recipe(
+            name=name, text=str(data['text']),
+            cooking_time=cooking_time, image=image,
+            author_id=self.get_author_id(data.get('author')),
+        )
+        amounts = {}
+        for item in data['ingredients']:
+            key = (item['name'], item['measurement_unit'])
+            if key not in self.ingredients:
+                raise ValueError(f'Ингредиент {key[0]} не найден.')
+            amount = int(item['amount'])
+            if amount < 1:
+                raise ValueError('Количество должно быть больше нуля.')
+            amounts[self.ingredients[key]] = amount
+        tags = []
+        for slug in data['tags']:
+            if slug not in self.tags:
+                raise ValueError(f'Тег {slug} не найден.')
+            tags.append(self.tags[slug])
+        return recipe, amounts, set(tags)
+
+    def save(self, chunk):
+        """Создает пачку рецептов, их ингредиенты и теги в одной
+        транзакции.
+        """
+        with transaction.atomic():
+            existing = set(Recipe.objects.filter(
+                author_id__in={recipe.author_id for recipe, _, _ in chunk},
+                name__in={recipe.name for recipe, _, _ in chunk},
+            ).values_list('author_id', 'name'))
+            rows = []
+            for recipe, amounts, tags in chunk:
+                key = (recipe.author_id, recipe.name)
+                if key in existing:
+                    self.result.skipped += 1
+                    continue
+                existing.add(key)
+                rows.append((recipe, amounts, tags))
+            Recipe.objects.bulk_create(recipe for recipe, _, _ in rows)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                                 amount=amount)
+                for recipe, amounts, _ in rows
+                for ingredient_id, amount in amounts.items())
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                for recipe, _, tags in rows
+                for tag_id in tags)
+            RecipeChange.record(
+                [recipe.pk for recipe, _, _ in rows], RecipeChange.CREATED)
+            ImageBlob.acquire(recipe.image.name for recipe, _, _ in rows)
+            if rows:
+                recipes_imported.send(
+                    sender=Recipe,
+                    recipe_ids=[recipe.pk for recipe, _, _ in rows])
+        self.result.created += len(rows)
+
+
+def import_recipes(lines, author=None, chunk_size=CHUNK_SIZE):
+    """Загружает рецепты из итерируемого набора строк NDJSON."""
+    return RecipeImporter(author, chunk_size).run(lines)
@@ -0,0 +1,81 @@
+"""Журнал изменений рецептов для инкрементальной синхронизации.
+
+Клиент хранит курсор -- seq последнего полученного события -- и
+запрашивает только события после него. В пачке остается одно, последнее
+событие на рецепт. Сжатие журнала удаляет события, перекрытые более
+поздними событиями того же рецепта (это не влияет ни на один курсор),
+и старые записи об удалении. После удаления записей об удалении клиент
+с курсором меньше границы сжатия мог бы пропустить удаление, поэтому
+такой курсор считается устаревшим и требует полной синхронизации.
+
+seq выдается при вставке, а транзакции фиксируются не в порядке seq:
+событие 101 может стать видимым раньше события 100. Чтобы курсор
+не перешагнул еще не зафиксированное событие, пачка обрывается на первом
+событии моложе CHANGES_SAFETY_LAG. Транзакции, пишущие в журнал, должны
+быть короче этой задержки.
+"""
+from django.conf import settings
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import RecipeChange, RecipeChangeCompaction
+
+
+class CursorExpiredError(Exception):
+    """Курсор старше границы сжатия журнала."""
+
+
+def compaction_floor() -> int:
+    return RecipeChangeCompaction.objects.aggregate(
+        floor=Max('floor'))['floor'] or 0
+
+
+def changes_since(cursor, limit):
+    """Возвращает (события, новый курсор, есть ли еще события).
+    События -- список пар (id рецепта, действие) по одной на рецепт
+    в порядке последнего изменения.
+    Курсор 0 означает первую синхронизацию и не устаревает.
+    События моложе CHANGES_SAFETY_LAG и все следующие за ними
+    возвращаются при следующих запросах.
+    """
+    if 0 < cursor < compaction_floor():
+        raise CursorExpiredError(cursor)
+    rows = list(RecipeChange.objects.filter(seq__gt=cursor).order_by(
+        'seq').values_list('seq', 'recipe_id', 'action', 'created')[
+            :limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    settled = timezone.now() - settings.CHANGES_SAFETY_LAG
+    for index, (_, _, _, created) in enumerate(rows):
+        if created >= settled:
+            rows = rows[:index]
+            has_more = False
+            break
+    latest = {}
+    for _, recipe_id, action, _ in rows:
+        latest.pop(recipe_id, None)
+        latest[recipe_id] = action
+    next_cursor = rows[-1][0] if rows else cursor
+    return list(latest.items()), next_cursor, has_more
+
+
+def compact_changes(tombstone_max_age) -> tuple:
+    """Сжимает журнал изменений.
+    tombstone_max_age -- timedelta, сколько хранить записи об удалении.
+    Возвращает количество удаленных перекрытых событий и записей
+    об удалении.
+    """
+    superseded, _ = RecipeChange.objects.filter(
+        seq__lt=Subquery(
+            RecipeChange.objects.filter(recipe_id=OuterRef('recipe_id'))
+            .order_by('-seq').values('seq')[:1])
+    ).delete()
+    tombstones = RecipeChange.objects.filter(
+        action=RecipeChange.DELETED,
+        created__lt=timezone.now() - tombstone_max_age)
+    floor = tombstones.aggregate(floor=Max('seq'))['floor']
+    if floor is None:
+        return superseded, 0
+    RecipeChangeCompaction.objects.create(floor=floor)
+    removed, _ = tombstones.filter(seq__lte=floor).delete()
+    return superseded, removed
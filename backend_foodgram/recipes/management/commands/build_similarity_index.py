@@ -0,0 +1,35 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from recipes.similarity import build_index
+
+
+class Command(BaseCommand):
+    help = """
+        Builds the MinHash/LSH index used by /api/recipes/{id}/similar/.
+        Without --full only recipes from the change log since the
+        previous build are recomputed, deleted recipes are dropped from
+        the index. With --interval the command keeps running and
+        updates the index every given number of seconds.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild the index from scratch.')
+        parser.add_argument('--interval', type=float,
+                            help='Repeat the update every N seconds.')
+
+    def run(self, full):
+        index, changed = build_index(full=full)
+        self.stdout.write(self.style.SUCCESS(
+            f'Index built: {len(index.ids)} recipes, '
+            f'{changed} recomputed.'))
+
+    def handle(self, *args, **options):
+        self.run(options['full'])
+        while options['interval']:
+            time.sleep(options['interval'])
+            close_old_connections()
+            self.run(False)
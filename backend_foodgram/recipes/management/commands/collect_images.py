@@ -0,0 +1,84 @@
+import os
+import time
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from recipes.models import ImageBlob, Recipe
+from recipes.storage import image_storage
+
+IMAGES_DIR = 'images'
+
+
+def walk_files(root):
+    """Генератор (имя относительно MEDIA_ROOT, время изменения) файлов
+    каталога root. Каталоги читаются по одному через os.scandir.
+    """
+    stack = [os.path.join(image_storage.location, root)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, image_storage.location)
+                    yield (name.replace(os.sep, '/'),
+                           entry.stat(follow_symlinks=False).st_mtime)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = """
+        Removes recipe images that no recipe references.
+        Files are scanned in chunks with os.scandir and checked against
+        image reference counts and recipes. Files younger than --grace
+        minutes are kept: they may belong to a recipe being saved.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Files checked per database query.')
+        parser.add_argument('--grace', type=float, default=60,
+                            help='Keep files younger than N minutes.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report files to remove.')
+
+    def referenced(self, names):
+        return set(ImageBlob.objects.filter(
+            name__in=names, refs__gt=0).values_list('name', flat=True)
+        ).union(Recipe.objects.filter(
+            image__in=names).values_list('image', flat=True))
+
+    def handle(self, *args, **options):
+        deadline = time.time() - options['grace'] * 60
+        scanned = removed = 0
+        for chunk in chunked(walk_files(IMAGES_DIR), options['chunk_size']):
+            referenced = self.referenced([name for name, _ in chunk])
+            for name, mtime in chunk:
+                if name in referenced or mtime >= deadline:
+                    continue
+                if not options['dry_run']:
+                    image_storage.delete(name)
+                removed += 1
+            scanned += len(chunk)
+            self.stdout.write(f'Scanned {scanned} files, '
+                              f'unreferenced {removed}.')
+        if not options['dry_run']:
+            ImageBlob.objects.filter(
+                refs__lte=0,
+                updated__lt=timezone.now() - timedelta(
+                    minutes=options['grace'])).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Found" if options["dry_run"] else "Removed"} '
+            f'{removed} of {scanned} files.'))
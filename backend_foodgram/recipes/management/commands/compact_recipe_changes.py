@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from recipes.changes import compact_changes
+
+
+class Command(BaseCommand):
+    help = """
+        Compacts the recipe change log: keeps only the latest event of
+        every recipe and removes deletion events older than
+        CHANGES_TOMBSTONE_TTL. Clients with a cursor older than the
+        removed deletions get 410 and have to sync from scratch.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float,
+                            help='Keep deletion events for N days.')
+
+    def handle(self, *args, **options):
+        max_age = settings.CHANGES_TOMBSTONE_TTL
+        if options['days'] is not None:
+            max_age = timedelta(days=options['days'])
+        superseded, tombstones = compact_changes(max_age)
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {superseded} superseded events '
+            f'and {tombstones} deletion events.'))
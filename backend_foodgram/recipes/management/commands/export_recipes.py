@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management import BaseCommand
+
+from recipes.catalog import CHUNK_SIZE, export_recipes
+
+
+class Command(BaseCommand):
+    help = 'Exports all recipes as NDJSON to a file or stdout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-',
+                            help='Output file, "-" for stdout.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows fetched per database round trip.')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        stream = (sys.stdout.buffer if output == '-'
+                  else open(output, 'wb'))
+        count = 0
+        try:
+            for line in export_recipes(chunk_size=options['chunk_size']):
+                stream.write(line)
+                count += 1
+        finally:
+            if output != '-':
+                stream.close()
+        if output != '-':
+            self.stdout.write(f'Exported {count} recipes to {output}.')
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+
+from recipes.catalog import CHUNK_SIZE, import_recipes
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = """
+        Imports recipes from an NDJSON file made by export_recipes.
+        Recipes are created in chunks, one transaction per chunk.
+        Recipes that the author already has are skipped.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Recipes per transaction.')
+        parser.add_argument('--author',
+                            help='Email of the author for all recipes.')
+
+    def handle(self, *args, **options):
+        author = None
+        if options['author']:
+            author = User.objects.filter(email=options['author']).first()
+            if author is None:
+                raise CommandError(f'User {options["author"]} not found.')
+        with open(options['path'], 'rb') as lines:
+            result = import_recipes(lines, author, options['chunk_size'])
+        for line, error in result.errors:
+            self.stderr.write(f'Line {line}: {error}')
+        self.stdout.write(f'Created {result.created} recipes, '
+                          f'skipped {result.skipped}, '
+                          f'errors {len(result.errors)}.')
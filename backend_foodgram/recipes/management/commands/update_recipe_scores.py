@@ -0,0 +1,39 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from recipes.models import Recipe
+from recipes.scoring import update_scores
+
+
+class Command(BaseCommand):
+    help = """
+        Recomputes trending and popular scores of recipes.
+        Only recipes with new favorites/shopping cart additions since
+        the previous run are recomputed unless --full is given.
+        With --interval the command keeps running and repeats the
+        update every given number of seconds.
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute scores of all recipes.')
+        parser.add_argument('--interval', type=float,
+                            help='Repeat the update every N seconds.')
+
+    def run(self, full):
+        recipe_ids = None
+        if full:
+            recipe_ids = list(
+                Recipe.objects.order_by('pk').values_list('pk', flat=True))
+        updated = update_scores(recipe_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Scores updated for {updated} recipes.'))
+
+    def handle(self, *args, **options):
+        self.run(options['full'])
+        while options['interval']:
+            time.sleep(options['interval'])
+            close_old_connections()
+            self.run(False)
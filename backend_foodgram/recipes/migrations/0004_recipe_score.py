@@ -0,0 +1,53 @@
+# Generated by Django 4.1.4 on 2026-10-19 09:33
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.PositiveIntegerField(default=0, verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='score',
+            field=models.FloatField(default=0, verbose_name='Рейтинг в трендах'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='score_updated',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата расчета рейтинга'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-score', '-created'], name='recipe_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-created'], name='recipe_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['score_updated'], name='recipe_score_updated_idx'),
+        ),
+    ]
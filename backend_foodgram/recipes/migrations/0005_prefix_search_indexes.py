@@ -0,0 +1,38 @@
+from django.db import migrations
+
+INDEXES = (
+    ('recipes_ingredient_name_prefix_idx', 'recipes_ingredient', 'name'),
+    ('recipes_recipe_name_prefix_idx', 'recipes_recipe', 'name'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    """Индексы для поиска по началу строки без учета регистра
+    (lookup istartswith, поиск `^name` в API и админке).
+    Нужны только PostgreSQL: оператор LIKE использует индекс
+    с классом операторов varchar_pattern_ops.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} '
+            f'(UPPER({column}::text) varchar_pattern_ops)')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.1.4 on 2026-10-19 09:41
+
+from django.db import migrations, models
+
+
+def seed_change_log(apps, schema_editor):
+    """Записывает существующие рецепты в журнал как созданные,
+    чтобы первая синхронизация с курсора 0 вернула весь каталог.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeChange = apps.get_model('recipes', 'RecipeChange')
+    batch = []
+    for recipe_id in Recipe.objects.order_by('pk').values_list(
+            'pk', flat=True).iterator(chunk_size=2000):
+        batch.append(RecipeChange(recipe_id=recipe_id, action='created'))
+        if len(batch) >= 2000:
+            RecipeChange.objects.bulk_create(batch)
+            batch = []
+    RecipeChange.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_index_audit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('recipe_id', models.PositiveIntegerField(verbose_name='id рецепта')),
+                ('action', models.CharField(choices=[('created', 'Создан'), ('updated', 'Изменен'), ('deleted', 'Удален')], max_length=7, verbose_name='Действие')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение рецепта',
+                'verbose_name_plural': 'Журнал изменений рецептов',
+                'ordering': ['seq'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeChangeCompaction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('floor', models.BigIntegerField(verbose_name='Граница')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата сжатия')),
+            ],
+            options={
+                'verbose_name': 'Сжатие журнала изменений',
+                'verbose_name_plural': 'Сжатия журнала изменений',
+                'ordering': ['-floor'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipechange',
+            index=models.Index(fields=['recipe_id', 'seq'], name='recipe_change_recipe_idx'),
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
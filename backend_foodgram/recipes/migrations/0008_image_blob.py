@@ -0,0 +1,49 @@
+# Generated by Django 4.1.4 on 2026-10-19 09:43
+
+from django.db import migrations, models
+from django.db.models import Count
+
+import recipes.storage
+
+
+def count_image_refs(apps, schema_editor):
+    """Заполняет счетчики ссылок по картинкам существующих рецептов."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ImageBlob = apps.get_model('recipes', 'ImageBlob')
+    ImageBlob.objects.bulk_create(
+        (ImageBlob(name=row['image'], refs=row['refs'])
+         for row in Recipe.objects.exclude(image='').values('image').annotate(
+             refs=Count('pk')).order_by()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_change_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Файл')),
+                ('refs', models.IntegerField(default=0, verbose_name='Ссылок')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.ContentAddressedStorage(), upload_to='images/', verbose_name='Фото'),
+        ),
+        migrations.AddIndex(
+            model_name='imageblob',
+            index=models.Index(condition=models.Q(('refs__lte', 0)), fields=['updated'], name='image_blob_orphan_idx'),
+        ),
+        migrations.RunPython(count_image_refs, migrations.RunPython.noop),
+    ]
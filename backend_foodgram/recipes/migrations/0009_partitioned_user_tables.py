@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db import migrations
+
+from api.partitioning import create_partitioned, drop_partitioned
+
+TABLES = ('recipes_favorite', 'recipes_shoppingcart')
+
+
+def create_tables(apps, schema_editor):
+    """Секционированные копии избранного и списка покупок
+    (см. api/partitioning.py). Создаются только на PostgreSQL
+    и только если задан USER_TABLE_PARTITIONS; данные переносит
+    команда partition_tables.
+    """
+    if (schema_editor.connection.vendor != 'postgresql'
+            or not settings.USER_TABLE_PARTITIONS):
+        return
+    for table in TABLES:
+        create_partitioned(table, settings.USER_TABLE_PARTITIONS)
+
+
+def drop_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        drop_partitioned(table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_image_blob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_tables, drop_tables),
+    ]
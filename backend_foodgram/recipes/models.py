@@ -1,7 +1,17 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import F
 from django.urls import reverse
+from django.utils import timezone
+
+from .storage import image_storage
+
+_suppressed = threading.local()
 
 
 class Recipe(models.Model):
@@ -12,8 +22,10 @@ class Recipe(models.Model):
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
         related_name='recipes',
         verbose_name='Автор',
+        db_index=False,
     )
-    image = models.ImageField('Фото', upload_to='images/')
+    image = models.ImageField(
+        'Фото', upload_to='images/', storage=image_storage)
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления',
         validators=[MinValueValidator(
@@ -24,11 +36,30 @@ class Recipe(models.Model):
         'Ingredient', through='RecipeIngredient'
     )
     created = models.DateTimeField('Дата создания', auto_now_add=True)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+    score = models.FloatField('Рейтинг в трендах', default=0)
+    popularity = models.PositiveIntegerField('Популярность', default=0)
+    score_updated = models.DateTimeField(
+        'Дата расчета рейтинга', null=True, blank=True)
 
     class Meta:
         ordering = ['-created', 'name']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-created', 'name'],
+                         name='recipe_created_name_idx'),
+            models.Index(fields=['author', '-created'],
+                         name='recipe_author_created_idx'),
+            models.Index(fields=['-score', '-created'],
+                         name='recipe_trending_idx'),
+            models.Index(fields=['-popularity', '-created'],
+                         name='recipe_popular_idx'),
+            models.Index(fields=['score_updated'],
+                         name='recipe_score_updated_idx'),
+            models.Index(fields=['id'], name='recipe_needs_rescore_idx',
+                         condition=models.Q(score_updated__isnull=True)),
+        ]
         constraints = [
             models.UniqueConstraint(fields=['name', 'author'],
                                     name='unique_recipe_author')
@@ -40,6 +71,44 @@ class Recipe(models.Model):
     def get_absolute_url(self):
         return reverse('recipe-detail', kwargs={'recipe_id': self.pk})
 
+    def touch(self):
+        """Обновляет дату изменения рецепта без вызова save()."""
+        Recipe.touch_many([self.pk])
+
+    @staticmethod
+    @contextmanager
+    def touch_suppressed(recipe_id):
+        """Внутри блока touch_many не трогает рецепт recipe_id.
+        Для записи рецепта целиком (RecipeSerializer): изменения его
+        ингредиентов и тегов не меняют версию построчно, версию
+        и запись в журнале дает одно сохранение рецепта.
+        """
+        ids = getattr(_suppressed, 'ids', None)
+        if ids is None:
+            ids = _suppressed.ids = set()
+        added = recipe_id not in ids
+        ids.add(recipe_id)
+        try:
+            yield
+        finally:
+            if added:
+                ids.discard(recipe_id)
+
+    @staticmethod
+    def touch_many(recipe_ids):
+        """Обновляет дату изменения у рецептов с переданными id
+        и записывает изменения в журнал.
+        """
+        recipe_ids = [
+            pk for pk in Recipe.objects.filter(
+                pk__in=recipe_ids).values_list('pk', flat=True)
+            if pk not in getattr(_suppressed, 'ids', ())]
+        if not recipe_ids:
+            return
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            updated=timezone.now())
+        RecipeChange.record(recipe_ids, RecipeChange.UPDATED)
+
 
 class Tag(models.Model):
     """Модель тега для рецептов."""
@@ -63,7 +132,7 @@ class Tag(models.Model):
 
 class Ingredient(models.Model):
     """Модель ингредиента для рецептов."""
-    name = models.CharField('Название', max_length=200)
+    name = models.CharField('Название', max_length=200, db_index=True)
     measurement_unit = models.CharField('Ед. изм.', max_length=200)
 
     class Meta:
@@ -81,7 +150,8 @@ class Ingredient(models.Model):
 class RecipeIngredient(models.Model):
     """Промежуточная модель для связи рецепта и ингредиента."""
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
-    ingredient = models.ForeignKey(Ingredient, on_delete=models.PROTECT)
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.PROTECT, db_index=False)
     amount = models.PositiveSmallIntegerField(
         'Количество',
         validators=[MinValueValidator(
@@ -89,7 +159,7 @@ class RecipeIngredient(models.Model):
     )
 
     class Meta:
-        ordering = ['recipe__name']
+        ordering = ['id']
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецептах'
         constraints = [
@@ -104,40 +174,148 @@ class RecipeIngredient(models.Model):
 class Favorite(models.Model):
     """Модель для связи избранного рецепта и пользователя."""
     recipe = models.ForeignKey(
-        Recipe, on_delete=models.CASCADE, related_name='favorites')
+        Recipe, on_delete=models.CASCADE, related_name='favorites',
+        db_index=False)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
-        related_name='favorites')
+        related_name='favorites', db_index=False)
+    created = models.DateTimeField(
+        'Дата добавления', auto_now_add=True, db_index=True)
 
     class Meta:
-        ordering = ['recipe', 'user']
+        ordering = ['id']
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='favorite_recipe_user_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='unique_user_favorite_recipe')
         ]
 
     def __str__(self):
-        return '{self.user}: {self.recipe}'
+        return f'{self.user}: {self.recipe}'
 
 
 class ShoppingCart(models.Model):
     """Модель связывает пользователя и добавленные в корзину рецепты."""
     recipe = models.ForeignKey(
-        Recipe, on_delete=models.CASCADE, related_name='shopping_cart')
+        Recipe, on_delete=models.CASCADE, related_name='shopping_cart',
+        db_index=False)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
-        related_name='shopping_cart')
+        related_name='shopping_cart', db_index=False)
+    created = models.DateTimeField(
+        'Дата добавления', auto_now_add=True, db_index=True)
 
     class Meta:
-        ordering = ['recipe', 'user']
+        ordering = ['id']
         verbose_name = 'Рецепт из списка покупок'
         verbose_name_plural = 'Список покупок'
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='cart_recipe_user_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='unique_user_recipe_in_cart')
         ]
 
     def __str__(self):
-        return '{self.user}: {self.recipe}'
+        return f'{self.user}: {self.recipe}'
+
+
+class RecipeChange(models.Model):
+    """Журнал изменений рецептов для инкрементальной синхронизации.
+    seq монотонно растет, удаленные рецепты остаются в журнале
+    записями с действием deleted.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTIONS = (
+        (CREATED, 'Создан'),
+        (UPDATED, 'Изменен'),
+        (DELETED, 'Удален'),
+    )
+
+    seq = models.BigAutoField(primary_key=True)
+    recipe_id = models.PositiveIntegerField('id рецепта')
+    action = models.CharField('Действие', max_length=7, choices=ACTIONS)
+    created = models.DateTimeField('Дата изменения', auto_now_add=True)
+
+    class Meta:
+        ordering = ['seq']
+        verbose_name = 'Изменение рецепта'
+        verbose_name_plural = 'Журнал изменений рецептов'
+        indexes = [
+            models.Index(fields=['recipe_id', 'seq'],
+                         name='recipe_change_recipe_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.seq}: {self.recipe_id} {self.action}'
+
+    @classmethod
+    def record(cls, recipe_ids, action):
+        """Записывает одно событие action для каждого рецепта."""
+        cls.objects.bulk_create(
+            cls(recipe_id=recipe_id, action=action)
+            for recipe_id in recipe_ids)
+
+
+class RecipeChangeCompaction(models.Model):
+    """Граница сжатия журнала: события удаления с seq не больше floor
+    удалены, клиентам с курсором меньше floor нужна полная синхронизация.
+    """
+    floor = models.BigIntegerField('Граница')
+    created = models.DateTimeField('Дата сжатия', auto_now_add=True)
+
+    class Meta:
+        ordering = ['-floor']
+        verbose_name = 'Сжатие журнала изменений'
+        verbose_name_plural = 'Сжатия журнала изменений'
+
+    def __str__(self):
+        return f'{self.created}: {self.floor}'
+
+
+class ImageBlob(models.Model):
+    """Счетчик ссылок рецептов на файл картинки."""
+    name = models.CharField('Файл', max_length=255, primary_key=True)
+    refs = models.IntegerField('Ссылок', default=0)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+        indexes = [
+            models.Index(fields=['updated'], name='image_blob_orphan_idx',
+                         condition=models.Q(refs__lte=0)),
+        ]
+
+    def __str__(self):
+        return f'{self.name}: {self.refs}'
+
+    @classmethod
+    def change_refs(cls, names, delta):
+        """Меняет счетчики ссылок файлов names на delta
+        за каждое вхождение имени.
+        """
+        now = timezone.now()
+        for name, count in Counter(filter(None, names)).items():
+            blobs = cls.objects.filter(name=name)
+            if not blobs.update(refs=F('refs') + delta * count,
+                                updated=now):
+                cls.objects.get_or_create(name=name)
+                blobs.update(refs=F('refs') + delta * count, updated=now)
+
+    @classmethod
+    def acquire(cls, names):
+        cls.change_refs(names, 1)
+
+    @classmethod
+    def release(cls, names):
+        cls.change_refs(names, -1)
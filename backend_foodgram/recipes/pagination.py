@@ -0,0 +1,29 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+ESTIMATE_THRESHOLD = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админ панели для больших таблиц.
+    Для списка без фильтров на PostgreSQL количество строк берется из
+    статистики планировщика (pg_class.reltuples) вместо COUNT(*),
+    если таблица больше ESTIMATE_THRESHOLD строк.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            connection = connections[self.object_list.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT reltuples::bigint FROM pg_class '
+                        'WHERE relname = %s',
+                        [self.object_list.model._meta.db_table])
+                    row = cursor.fetchone()
+                if row and row[0] > ESTIMATE_THRESHOLD:
+                    return row[0]
+        return super().count
@@ -0,0 +1,95 @@
+"""Расчет рейтингов рецептов для сортировок trending и popular.
+
+popularity -- число добавлений рецепта в Избранное и Список покупок.
+score -- сумма весов добавлений, затухающая со временем с периодом
+полураспада TRENDING_HALF_LIFE. Сумма хранится в логарифмической шкале
+относительно фиксированной даты EPOCH:
+    score = log(sum(weight * exp((created - EPOCH) / tau)))
+При таком представлении затухание одинаково для всех рецептов и не
+меняет их порядок, поэтому пересчитывать нужно только рецепты с новыми
+добавлениями. Рецепты, из которых добавления удалялись, помечаются
+сигналом (score_updated = None) и тоже попадают в пересчет.
+Дата добавления выставляется до фиксации транзакции, поэтому
+добавление может стать видимым после расчета, начатого позже этой
+даты. Новые добавления ищутся с перекрытием TRENDING_SAFETY_LAG;
+транзакции, создающие добавления, должны быть короче этой задержки.
+Повторный пересчет рецепта дает тот же результат.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Favorite, Recipe, ShoppingCart
+
+EPOCH = datetime(2023, 1, 1, tzinfo=dt_timezone.utc)
+CHUNK_SIZE = 1000
+
+
+def _tau():
+    return settings.TRENDING_HALF_LIFE.total_seconds() / math.log(2)
+
+
+def interactions(recipe_ids):
+    """Возвращает словарь {id рецепта: [(вес, дата добавления), ...]}."""
+    weights = settings.TRENDING_WEIGHTS
+    result = defaultdict(list)
+    for model in (Favorite, ShoppingCart):
+        weight = weights[model._meta.model_name]
+        for recipe_id, created in model.objects.filter(
+                recipe_id__in=recipe_ids).order_by().values_list(
+                    'recipe_id', 'created'):
+            result[recipe_id].append((weight, created))
+    return result
+
+
+def trending_score(items, tau) -> float:
+    """Возвращает затухающую сумму весов в логарифмической шкале."""
+    if not items:
+        return 0
+    exponents = [math.log(weight) + (created - EPOCH).total_seconds() / tau
+                 for weight, created in items]
+    top = max(exponents)
+    return top + math.log(sum(math.exp(x - top) for x in exponents))
+
+
+def changed_recipes():
+    """Возвращает id рецептов, рейтинг которых нужно пересчитать:
+    с добавлениями позже прошлого расчета (с перекрытием
+    TRENDING_SAFETY_LAG) и помеченные к пересчету.
+    """
+    last = Recipe.objects.aggregate(last=Max('score_updated'))['last']
+    changed = set(Recipe.objects.filter(
+        score_updated__isnull=True).values_list('pk', flat=True))
+    if last is not None:
+        since = last - settings.TRENDING_SAFETY_LAG
+        for model in (Favorite, ShoppingCart):
+            changed.update(model.objects.filter(
+                created__gt=since).values_list('recipe_id', flat=True))
+    return sorted(changed)
+
+
+def update_scores(recipe_ids=None) -> int:
+    """Пересчитывает рейтинги рецептов порциями по CHUNK_SIZE.
+    По умолчанию пересчитываются только измененные рецепты.
+    Возвращает количество пересчитанных рецептов.
+    """
+    started = timezone.now()
+    if recipe_ids is None:
+        recipe_ids = changed_recipes()
+    tau = _tau()
+    for start in range(0, len(recipe_ids), CHUNK_SIZE):
+        chunk = recipe_ids[start:start + CHUNK_SIZE]
+        items = interactions(chunk)
+        Recipe.objects.bulk_update(
+            [Recipe(pk=pk,
+                    score=trending_score(items[pk], tau),
+                    popularity=len(items[pk]),
+                    score_updated=started)
+             for pk in chunk],
+            ['score', 'popularity', 'score_updated'])
+    return len(recipe_ids)
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import Signal, receiver
+
+from .models import (Favorite, ImageBlob, Ingredient, Recipe, RecipeChange,
+                     RecipeIngredient, ShoppingCart, Tag)
+
+AUTHOR_FIELDS = frozenset(('email', 'username', 'first_name', 'last_name'))
+
+# Рецепты созданы загрузкой каталога (bulk_create, без post_save).
+# Аргумент recipe_ids -- список id созданных рецептов.
+recipes_imported = Signal()
+
+
+@receiver(post_save, sender=Recipe)
+def record_recipe_save(sender, instance, created, **kwargs):
+    """Сохранение рецепта записывается в журнал изменений."""
+    RecipeChange.record(
+        [instance.pk],
+        RecipeChange.CREATED if created else RecipeChange.UPDATED)
+
+
+@receiver(post_delete, sender=Recipe)
+def record_recipe_delete(sender, instance, **kwargs):
+    """Удаление рецепта оставляет в журнале запись об удалении."""
+    RecipeChange.record([instance.pk], RecipeChange.DELETED)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def touch_recipe_on_ingredient_change(sender, instance, **kwargs):
+    """Изменение ингредиентов меняет версию рецепта."""
+    Recipe.touch_many([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_on_tags_change(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    """Изменение тегов меняет версию рецепта."""
+    if reverse:
+        if action == 'pre_clear':
+            Recipe.touch_many(
+                Recipe.objects.filter(tags=instance).values('pk'))
+        elif action in ('post_add', 'post_remove'):
+            Recipe.touch_many(pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        instance.touch()
+
+
+@receiver(post_save, sender=Tag)
+def touch_recipes_on_tag_change(sender, instance, created, **kwargs):
+    """Изменение тега меняет версию всех рецептов с этим тегом."""
+    if not created:
+        Recipe.touch_many(
+            Recipe.objects.filter(tags=instance).values('pk'))
+
+
+@receiver(pre_delete, sender=Tag)
+def touch_recipes_on_tag_delete(sender, instance, **kwargs):
+    """Удаление тега меняет версию всех рецептов с этим тегом.
+    Связи с рецептами удаляются без сигнала m2m_changed, поэтому
+    рецепты выбираются до удаления.
+    """
+    Recipe.touch_many(list(
+        Recipe.objects.filter(tags=instance).values_list('pk', flat=True)))
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_recipes_on_ingredient_rename(sender, instance, created, **kwargs):
+    """Изменение ингредиента меняет версию всех рецептов с ним."""
+    if not created:
+        Recipe.touch_many(
+            RecipeIngredient.objects.filter(
+                ingredient=instance).values('recipe_id'))
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def remember_author_fields(sender, instance, update_fields, **kwargs):
+    """Запоминает данные автора, которые входят во фрагменты рецептов."""
+    instance._saved_author = None
+    if instance.pk is not None and (
+            update_fields is None
+            or AUTHOR_FIELDS.intersection(update_fields)):
+        instance._saved_author = sender.objects.filter(
+            pk=instance.pk).values(*AUTHOR_FIELDS).first()
+
+
+def author_changed(instance) -> bool:
+    """Изменились ли при сохранении пользователя данные автора,
+    входящие во фрагменты рецептов.
+    """
+    saved = getattr(instance, '_saved_author', None)
+    return saved is not None and any(
+        getattr(instance, name) != value for name, value in saved.items())
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def touch_recipes_on_author_change(sender, instance, created, **kwargs):
+    """Изменение данных автора, которые входят во фрагменты рецептов,
+    меняет версию всех его рецептов. Сохранения без изменения этих
+    данных (смена пароля, last_login) рецепты не трогают.
+    """
+    if created or not author_changed(instance):
+        return
+    Recipe.touch_many(Recipe.objects.filter(author=instance).values('pk'))
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def mark_recipe_for_rescoring(sender, instance, **kwargs):
+    """Удаление добавления требует пересчета рейтинга рецепта."""
+    Recipe.objects.filter(pk=instance.recipe_id).update(score_updated=None)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_image(sender, instance, **kwargs):
+    """Запоминает прежнюю картинку рецепта для счетчика ссылок."""
+    instance._saved_image = None
+    if instance.pk is not None:
+        instance._saved_image = Recipe.objects.filter(
+            pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_refs_on_save(sender, instance, **kwargs):
+    """Замена картинки переносит ссылку на новый файл."""
+    old = getattr(instance, '_saved_image', None)
+    if old != instance.image.name:
+        ImageBlob.acquire([instance.image.name])
+        ImageBlob.release([old])
+
+
+@receiver(post_delete, sender=Recipe)
+def count_image_refs_on_delete(sender, instance, **kwargs):
+    """Удаление рецепта освобождает ссылку на его картинку."""
+    ImageBlob.release([instance.image.name])
@@ -0,0 +1,287 @@
+"""Поиск похожих рецептов по MinHash/LSH.
+
+Рецепт описывается множеством признаков: id его ингредиентов и тегов.
+Для каждого рецепта считается MinHash-сигнатура из NUM_PERM значений,
+доля совпадающих значений двух сигнатур оценивает коэффициент Жаккара
+их множеств. Сигнатура делится на BANDS полос по ROWS значений,
+хеш полосы является ключом LSH-корзины: рецепты, совпавшие хотя бы
+в одной полосе, становятся кандидатами и ранжируются по сигнатурам.
+
+Индекс хранится в SIMILARITY_INDEX_DIR набором .npy-файлов, которые
+процессы открывают через mmap. Каждая сборка пишется в отдельный
+каталог, файл CURRENT указывает на актуальную сборку.
+Индекс строит команда `build_similarity_index`. Сборка запоминает
+курсор журнала изменений рецептов (recipes.changes), при повторном
+запуске пересчитываются только рецепты из событий после курсора,
+удаленные рецепты убираются. С параметром --interval команда обновляет
+индекс периодически (сервис similarity в docker-compose), поэтому новые
+и измененные рецепты попадают в индекс без ручного запуска.
+"""
+import json
+import os
+import shutil
+import threading
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .changes import CursorExpiredError, changes_since
+from .models import Recipe, RecipeChange, RecipeIngredient
+
+NUM_PERM = 48
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+MAX_BUCKET = 500
+FEATURE_CHUNK = 1000
+CHANGES_BATCH = 1000
+PRIME = (1 << 31) - 1
+SEED = 20230101
+
+_random = np.random.RandomState(SEED)
+_A = _random.randint(1, PRIME, size=(NUM_PERM, 1), dtype=np.int64)
+_B = _random.randint(0, PRIME, size=(NUM_PERM, 1), dtype=np.int64)
+_BAND_MIX = _random.randint(
+    1, 1 << 62, size=ROWS, dtype=np.int64).astype(np.uint64)
+
+
+def recipe_features(recipe_ids):
+    """Возвращает словарь {id рецепта: массив признаков}.
+    Ингредиенты и теги кодируются четными и нечетными числами,
+    чтобы их id не пересекались.
+    """
+    features = defaultdict(list)
+    for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids).order_by().values_list(
+                'recipe_id', 'ingredient_id'):
+        features[recipe_id].append(ingredient_id * 2)
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids).order_by().values_list(
+                'recipe_id', 'tag_id'):
+        features[recipe_id].append(tag_id * 2 + 1)
+    return {recipe_id: np.array(values, dtype=np.int64)
+            for recipe_id, values in features.items()}
+
+
+def iter_features(recipe_ids):
+    """Порциями по FEATURE_CHUNK рецептов выдает пары (id, признаки)."""
+    for start in range(0, len(recipe_ids), FEATURE_CHUNK):
+        yield from recipe_features(
+            recipe_ids[start:start + FEATURE_CHUNK]).items()
+
+
+def minhash(features):
+    """Возвращает MinHash-сигнатуру множества признаков."""
+    hashed = (_A * (features[np.newaxis, :] % PRIME) + _B) % PRIME
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def band_keys(signatures):
+    """Возвращает ключи LSH-корзин: массив (число сигнатур, BANDS)."""
+    bands = signatures.reshape(len(signatures), BANDS, ROWS)
+    return (bands.astype(np.uint64) * _BAND_MIX).sum(axis=2)
+
+
+class SimilarityIndex:
+    """Неизменяемая сборка индекса похожих рецептов."""
+
+    def __init__(self, ids, signatures, built_at, cursor=0):
+        self.ids = ids
+        self.signatures = signatures
+        self.built_at = built_at
+        self.cursor = cursor
+        keys = band_keys(signatures).T
+        self.band_order = np.argsort(keys, axis=1, kind='stable')
+        self.band_keys = np.take_along_axis(keys, self.band_order, axis=1)
+
+    @classmethod
+    def build(cls, items, built_at, cursor=0):
+        """Строит сборку по парам (id рецепта, признаки)."""
+        ids, signatures = [], []
+        for recipe_id, features in items:
+            ids.append(recipe_id)
+            signatures.append(minhash(features))
+        ids = np.array(ids, dtype=np.int64)
+        signatures = np.array(signatures, dtype=np.uint32).reshape(
+            len(ids), NUM_PERM)
+        order = np.argsort(ids)
+        return cls(ids[order], signatures[order], built_at, cursor)
+
+    def update(self, changed_ids, removed_ids, built_at, cursor):
+        """Возвращает новую сборку, в которой пересчитаны рецепты
+        changed_ids и удалены рецепты removed_ids.
+        """
+        keep = ~np.isin(self.ids, list(changed_ids) + list(removed_ids))
+        fresh = SimilarityIndex.build(iter_features(changed_ids), built_at)
+        ids = np.concatenate((self.ids[keep], fresh.ids))
+        signatures = np.concatenate(
+            (self.signatures[keep], fresh.signatures))
+        order = np.argsort(ids)
+        return SimilarityIndex(
+            ids[order], signatures[order], built_at, cursor)
+
+    def signature(self, recipe_id):
+        row = np.searchsorted(self.ids, recipe_id)
+        if row < len(self.ids) and self.ids[row] == recipe_id:
+            return self.signatures[row]
+        return None
+
+    def query(self, signature, limit, exclude=None):
+        """Возвращает до limit пар (id рецепта, сходство)
+        в порядке убывания сходства.
+        """
+        keys = band_keys(signature[np.newaxis, :])[0]
+        candidates = []
+        for band, key in enumerate(keys):
+            left = np.searchsorted(self.band_keys[band], key, side='left')
+            right = np.searchsorted(self.band_keys[band], key, side='right')
+            candidates.append(
+                self.band_order[band, left:min(right, left + MAX_BUCKET)])
+        rows = np.unique(np.concatenate(candidates))
+        if exclude is not None:
+            rows = rows[self.ids[rows] != exclude]
+        scores = (self.signatures[rows] == signature).mean(axis=1)
+        top = np.argsort(-scores, kind='stable')[:limit]
+        return [(int(self.ids[rows[i]]), float(scores[i])) for i in top]
+
+    def save(self, directory):
+        """Сохраняет сборку в новый каталог и делает ее текущей."""
+        name = f'build-{self.built_at.timestamp():.6f}'
+        path = os.path.join(directory, name)
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'ids.npy'), self.ids)
+        np.save(os.path.join(path, 'signatures.npy'), self.signatures)
+        np.save(os.path.join(path, 'band_keys.npy'), self.band_keys)
+        np.save(os.path.join(path, 'band_order.npy'), self.band_order)
+        with open(os.path.join(path, 'meta.json'), 'w') as meta:
+            json.dump({'built_at': self.built_at.isoformat(),
+                       'cursor': self.cursor,
+                       'num_perm': NUM_PERM, 'bands': BANDS}, meta)
+        current = os.path.join(directory, 'CURRENT')
+        with open(current + '.tmp', 'w') as pointer:
+            pointer.write(name)
+        os.replace(current + '.tmp', current)
+        for old in os.listdir(directory):
+            if old.startswith('build-') and old < name:
+                shutil.rmtree(os.path.join(directory, old),
+                              ignore_errors=True)
+
+    @classmethod
+    def load(cls, path):
+        """Открывает сохраненную сборку через mmap."""
+        with open(os.path.join(path, 'meta.json')) as meta:
+            meta = json.load(meta)
+        index = cls.__new__(cls)
+        index.built_at = parse_datetime(meta['built_at'])
+        # У сборок без курсора обновлять нечего, их нужно пересобрать.
+        index.cursor = meta.get('cursor')
+        for name in ('ids', 'signatures', 'band_keys', 'band_order'):
+            setattr(index, name, np.load(
+                os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+        return index
+
+
+_loaded = {'name': None, 'index': None}
+_load_lock = threading.Lock()
+
+
+def current_build(directory=None):
+    """Возвращает имя текущей сборки или None, если индекса нет."""
+    directory = directory or settings.SIMILARITY_INDEX_DIR
+    try:
+        with open(os.path.join(directory, 'CURRENT')) as pointer:
+            return pointer.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def get_index():
+    """Возвращает текущую сборку индекса или None.
+    Новая сборка подхватывается процессом при следующем обращении.
+    """
+    name = current_build()
+    if name is None:
+        return None
+    with _load_lock:
+        if _loaded['name'] != name:
+            _loaded['index'] = SimilarityIndex.load(
+                os.path.join(settings.SIMILARITY_INDEX_DIR, name))
+            _loaded['name'] = name
+        return _loaded['index']
+
+
+def settled_cursor() -> int:
+    """Курсор журнала, до которого все события уже зафиксированы
+    (см. CHANGES_SAFETY_LAG в recipes.changes).
+    """
+    return RecipeChange.objects.filter(
+        created__lt=timezone.now() - settings.CHANGES_SAFETY_LAG,
+    ).aggregate(seq=Max('seq'))['seq'] or 0
+
+
+def pending_changes(cursor):
+    """Возвращает события журнала после курсора: множества измененных
+    и удаленных рецептов и новый курсор.
+    """
+    changed, removed = set(), set()
+    has_more = True
+    while has_more:
+        events, cursor, has_more = changes_since(cursor, CHANGES_BATCH)
+        for recipe_id, action in events:
+            changed.discard(recipe_id)
+            removed.discard(recipe_id)
+            if action == RecipeChange.DELETED:
+                removed.add(recipe_id)
+            else:
+                changed.add(recipe_id)
+    return changed, removed, cursor
+
+
+def build_index(full=False):
+    """Строит индекс заново или обновляет рецепты из журнала изменений.
+    Если изменений нет, новая сборка не сохраняется. Возвращает пару
+    (сборка, число пересчитанных рецептов).
+    """
+    started = timezone.now()
+    index = None if full else get_index()
+    if index is not None and index.cursor is not None:
+        try:
+            changed, removed, cursor = pending_changes(index.cursor)
+        except CursorExpiredError:
+            index = None
+        else:
+            if not (changed or removed):
+                return index, 0
+            changed = sorted(changed)
+            index = index.update(changed, sorted(removed), started, cursor)
+            index.save(settings.SIMILARITY_INDEX_DIR)
+            return index, len(changed)
+    # Курсор берется до чтения рецептов: события после него будут
+    # обработаны следующим обновлением, в худшем случае повторно.
+    cursor = settled_cursor()
+    changed = list(Recipe.objects.order_by('pk').values_list('pk', flat=True))
+    index = SimilarityIndex.build(iter_features(changed), started, cursor)
+    index.save(settings.SIMILARITY_INDEX_DIR)
+    return index, len(changed)
+
+
+def similar_recipes(recipe, limit):
+    """Возвращает id похожих рецептов и их сходство.
+    Если рецепт изменен после сборки индекса, его сигнатура
+    пересчитывается по данным из базы.
+    """
+    index = get_index()
+    if index is None:
+        return []
+    signature = None
+    if recipe.updated <= index.built_at:
+        signature = index.signature(recipe.pk)
+    if signature is None:
+        features = recipe_features([recipe.pk]).get(recipe.pk)
+        if features is None:
+            return []
+        signature = minhash(features)
+    return index.query(signature, limit, exclude=recipe.pk)
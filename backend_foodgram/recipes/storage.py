@@ -0,0 +1,48 @@
+"""Хранилище картинок рецептов с адресацией по содержимому.
+
+Файл называется по sha256 содержимого: images/ab/abcdef....png,
+поэтому одинаковые загрузки хранятся один раз. Сколько рецептов
+ссылается на файл, хранит модель ImageBlob: счетчики меняют сигналы
+при сохранении и удалении рецептов. Файлы без ссылок удаляет команда
+collect_images.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_digest(content) -> str:
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, сохраняющий файлы под именем хеша содержимого.
+    Если такой файл уже есть, он не записывается повторно.
+    """
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        digest = content_digest(content)
+        name = os.path.join(directory, digest[:2], digest + ext)
+        if self.exists(name):
+            # Обновляем время изменения, чтобы сборщик мусора
+            # не удалил файл до сохранения ссылающегося рецепта.
+            os.utime(self.path(name))
+            return name
+        saved = super()._save(name, content)
+        if saved != name:
+            # Тот же файл одновременно записал другой процесс.
+            self.delete(saved)
+        return name
+
+
+image_storage = ContentAddressedStorage()
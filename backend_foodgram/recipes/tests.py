@@ -0,0 +1,340 @@
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+
+import numpy as np
+import orjson
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import scoring, similarity
+from .catalog import export_recipes, import_recipes
+from .changes import changes_since
+from .models import (Favorite, ImageBlob, Ingredient, Recipe, RecipeChange,
+                     RecipeIngredient, ShoppingCart, Tag)
+from .storage import image_storage
+
+User = get_user_model()
+
+
+class ChangesSinceTests(TestCase):
+
+    def setUp(self):
+        RecipeChange.record([1, 2], RecipeChange.CREATED)
+        self.young = RecipeChange.objects.order_by('seq').last()
+        RecipeChange.objects.exclude(pk=self.young.pk).update(
+            created=self.young.created - timedelta(minutes=1))
+
+    @override_settings(CHANGES_SAFETY_LAG=timedelta(seconds=30))
+    def test_cursor_stops_before_unsettled_events(self):
+        events, cursor, has_more = changes_since(0, 10)
+        self.assertEqual(events, [(1, RecipeChange.CREATED)])
+        self.assertLess(cursor, self.young.seq)
+        self.assertFalse(has_more)
+
+    @override_settings(CHANGES_SAFETY_LAG=timedelta(0))
+    def test_settled_events_are_returned(self):
+        events, cursor, _ = changes_since(0, 10)
+        self.assertEqual(len(events), 2)
+        self.assertEqual(cursor, self.young.seq)
+
+
+class MinHashTests(TestCase):
+
+    def test_signatures_estimate_jaccard(self):
+        first = np.arange(0, 200, dtype=np.int64)
+        half = np.arange(100, 300, dtype=np.int64)
+        other = np.arange(1000, 1200, dtype=np.int64)
+        signature = similarity.minhash(first)
+        self.assertTrue((signature == similarity.minhash(first[::-1])).all())
+        # Коэффициент Жаккара first и half -- 1/3.
+        self.assertAlmostEqual(
+            (signature == similarity.minhash(half)).mean(), 1 / 3,
+            delta=0.2)
+        self.assertLess((signature == similarity.minhash(other)).mean(), 0.1)
+
+    def test_lsh_returns_candidates_by_similarity(self):
+        features = np.arange(0, 40, dtype=np.int64)
+        index = similarity.SimilarityIndex.build(
+            [(1, features), (2, features[:36]), (3, features + 1000),
+             (4, features)], timezone.now())
+        result = index.query(index.signature(1), 10, exclude=1)
+        self.assertEqual([recipe_id for recipe_id, _ in result][:2], [4, 2])
+        self.assertEqual(result[0][1], 1.0)
+        self.assertNotIn(3, [recipe_id for recipe_id, _ in result])
+
+
+@override_settings(CHANGES_SAFETY_LAG=timedelta(0))
+class SimilarityIndexBuildTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(SIMILARITY_INDEX_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.author = User.objects.create_user(
+            email='cook@example.com', username='cook', password='x')
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(20)]
+        self.soup = self.create_recipe('Суп', self.ingredients[:8])
+        self.cake = self.create_recipe('Торт', self.ingredients[10:18])
+
+    def create_recipe(self, name, ingredients):
+        recipe = Recipe.objects.create(
+            author=self.author, name=name, text='...', cooking_time=10,
+            image='images/recipe.png')
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients)
+        return recipe
+
+    def test_index_follows_change_log(self):
+        index, changed = similarity.build_index()
+        self.assertEqual(changed, 2)
+        self.assertEqual(similarity.build_index()[1], 0)
+        soup = self.create_recipe('Суп 2', self.ingredients[:8])
+        index, changed = similarity.build_index()
+        self.assertEqual(changed, 1)
+        self.assertEqual(list(index.ids),
+                         [self.soup.pk, self.cake.pk, soup.pk])
+        self.cake.delete()
+        index, _ = similarity.build_index()
+        self.assertEqual(list(index.ids), [self.soup.pk, soup.pk])
+
+    def test_similar_endpoint(self):
+        similarity.build_index()
+        soup = self.create_recipe('Суп 2', self.ingredients[:7])
+        similarity.build_index()
+        response = APIClient().get(f'/api/recipes/{self.soup.pk}/similar/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([recipe['id'] for recipe in response.data],
+                         [soup.pk])
+
+
+class AuthorChangeTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email='cook@example.com', username='cook', password='x')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Суп', text='...', cooking_time=10,
+            image='images/recipe.png')
+        self.version = Recipe.objects.get(pk=self.recipe.pk).updated
+        self.changes = RecipeChange.objects.count()
+
+    def assert_touched(self, touched):
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).updated != self.version,
+            touched)
+        self.assertEqual(
+            RecipeChange.objects.count(), self.changes + int(touched))
+
+    def test_password_change_keeps_recipes(self):
+        self.author.set_password('y')
+        self.author.save()
+        self.assert_touched(False)
+
+    def test_login_keeps_recipes(self):
+        self.author.last_login = timezone.now()
+        self.author.save(update_fields=['last_login'])
+        self.assert_touched(False)
+
+    def test_rename_touches_recipes(self):
+        self.author.first_name = 'Иван'
+        self.author.save()
+        self.assert_touched(True)
+
+
+class ScoringTests(TestCase):
+
+    def setUp(self):
+        author = User.objects.create_user(
+            email='cook@example.com', username='cook', password='x')
+        self.users = [
+            User.objects.create_user(
+                email=f'user{number}@example.com', username=f'user{number}',
+                password='x')
+            for number in range(2)]
+        self.old, self.fresh = (
+            Recipe.objects.create(
+                author=author, name=name, text='...', cooking_time=10,
+                image='images/recipe.png')
+            for name in ('Суп', 'Борщ'))
+
+    def ordering(self, ordering):
+        response = APIClient().get('/api/recipes/', {'ordering': ordering})
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_trending_prefers_fresh_and_popular_counts_all(self):
+        for user in self.users:
+            Favorite.objects.create(user=user, recipe=self.old)
+        Favorite.objects.update(created=timezone.now() - timedelta(days=30))
+        ShoppingCart.objects.create(user=self.users[0], recipe=self.fresh)
+        self.assertEqual(scoring.update_scores(), 2)
+        self.assertEqual(self.ordering('popular'),
+                         [self.old.pk, self.fresh.pk])
+        self.assertEqual(self.ordering('trending'),
+                         [self.fresh.pk, self.old.pk])
+
+    def test_late_committed_addition_is_rescored(self):
+        scoring.update_scores()
+        last = Recipe.objects.get(pk=self.old.pk).score_updated
+        # Добавление создано до прошлого расчета, но зафиксировано
+        # после него.
+        favorite = Favorite.objects.create(
+            user=self.users[0], recipe=self.old)
+        Favorite.objects.filter(pk=favorite.pk).update(
+            created=last - timedelta(seconds=1))
+        self.assertEqual(scoring.update_scores(), 1)
+        self.assertEqual(
+            Recipe.objects.get(pk=self.old.pk).popularity, 1)
+
+
+class CatalogTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(MEDIA_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.image = Recipe.image.field.storage.save(
+            'images/soup.png', ContentFile(b'soup'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author = User.objects.create_user(
+                email='cook@example.com', username='cook', password='x')
+            tag = Tag.objects.create(name='Обед', color='#00ff00',
+                                     slug='lunch')
+            salt = Ingredient.objects.create(name='Соль',
+                                             measurement_unit='г')
+            recipe = Recipe.objects.create(
+                author=self.author, name='Суп', text='...', cooking_time=10,
+                image=self.image)
+            recipe.tags.add(tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=salt, amount=5)
+        self.lines = list(export_recipes())
+
+    def line(self, **fields):
+        return orjson.dumps({**orjson.loads(self.lines[0]), **fields})
+
+    def test_round_trip(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.all().delete()
+        result = import_recipes(self.lines)
+        self.assertEqual((result.created, result.skipped, result.errors),
+                         (1, 0, []))
+        recipe = Recipe.objects.get()
+        self.assertEqual(
+            orjson.loads(next(export_recipes())),
+            {**orjson.loads(self.lines[0]), 'id': recipe.pk,
+             'created': recipe.created.isoformat(),
+             'updated': recipe.updated.isoformat()})
+        self.assertEqual(ImageBlob.objects.get(name=self.image).refs, 1)
+        self.assertEqual(
+            RecipeChange.objects.filter(recipe_id=recipe.pk).count(), 1)
+        result = import_recipes(self.lines)
+        self.assertEqual((result.created, result.skipped), (0, 1))
+
+    def test_bad_lines_are_rejected(self):
+        Recipe.objects.all().delete()
+        result = import_recipes([
+            b'{not json',
+            self.line(name='Щ' * 201),
+            self.line(image='images/missing.png'),
+            self.line(image='../../etc/passwd'),
+            self.line(tags=['dinner']),
+            self.line(cooking_time=0),
+            orjson.dumps({'name': 'Суп'}),
+            self.line(name='Борщ'),
+        ])
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _ in result.errors],
+                         [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(Recipe.objects.get().name, 'Борщ')
+
+    def test_import_refreshes_cached_lists(self):
+        client = APIClient()
+        self.assertEqual(
+            client.get('/api/recipes/').data['count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            import_recipes([self.line(name='Борщ')])
+        self.assertEqual(
+            client.get('/api/recipes/').data['count'], 2)
+
+    @override_settings(RECIPE_IMPORT_MAX_SIZE=10)
+    def test_api_import_size_is_limited(self):
+        admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='x')
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.post(
+            '/api/recipes/import/', self.line(name='Борщ'),
+            content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Recipe.objects.filter(name='Борщ').exists())
+
+
+class ImageStorageTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(MEDIA_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.author = User.objects.create_user(
+            email='cook@example.com', username='cook', password='x')
+
+    def save(self, content):
+        return image_storage.save('images/photo.png', ContentFile(content))
+
+    def create_recipe(self, image):
+        return Recipe.objects.create(
+            author=self.author, name=f'Рецепт {Recipe.objects.count()}',
+            text='...', cooking_time=10, image=image)
+
+    def refs(self, name):
+        return ImageBlob.objects.get(name=name).refs
+
+    def test_same_content_is_stored_once(self):
+        first = self.save(b'soup')
+        self.assertEqual(self.save(b'soup'), first)
+        self.assertNotEqual(self.save(b'borsch'), first)
+        directory = os.path.dirname(image_storage.path(first))
+        self.assertEqual(os.listdir(directory), [os.path.basename(first)])
+
+    def test_recipes_count_references(self):
+        soup, borsch = self.save(b'soup'), self.save(b'borsch')
+        first, second = self.create_recipe(soup), self.create_recipe(soup)
+        self.assertEqual(self.refs(soup), 2)
+        second.image = borsch
+        second.save()
+        self.assertEqual((self.refs(soup), self.refs(borsch)), (1, 1))
+        first.delete()
+        second.delete()
+        self.assertEqual((self.refs(soup), self.refs(borsch)), (0, 0))
+
+    def test_collect_images_removes_only_old_orphans(self):
+        used, old, young = (self.save(content)
+                            for content in (b'used', b'old', b'young'))
+        self.create_recipe(used)
+        hour_ago = time.time() - 60 * 60
+        for name in (used, old):
+            os.utime(image_storage.path(name), (hour_ago, hour_ago))
+        call_command('collect_images', '--grace', '30', '--dry-run',
+                     stdout=StringIO())
+        self.assertTrue(image_storage.exists(old))
+        call_command('collect_images', '--grace', '30', stdout=StringIO())
+        self.assertEqual(
+            [image_storage.exists(name) for name in (used, old, young)],
+            [True, False, True])
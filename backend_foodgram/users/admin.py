@@ -2,18 +2,51 @@ from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
 
+from api.deletion import delete_user, related_querysets
+from recipes.admin import LargeTableAdmin
+
 from .models import Subscription
 
 User = get_user_model()
 
 
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
-    list_filter = ('email', 'username', 'is_staff', 'is_active')
-    search_fields = ('username', 'email')
+class CustomUserAdmin(UserAdmin, LargeTableAdmin):
+    list_filter = ('is_staff', 'is_active')
+    search_fields = ('^username', '^email')
+
+    def get_deleted_objects(self, objs, request):
+        """Подтверждение удаления показывает количество связанных
+        строк вместо их полного списка. Как и в стандартной проверке,
+        удаление запрещено, если у пользователя нет права удалять
+        связанные строки моделей, зарегистрированных в админке.
+        """
+        users = list(objs)
+        user_ids = [user.pk for user in users]
+        perms_needed = set()
+        counts = {}
+        for queryset in related_querysets(user_ids):
+            name = queryset.model._meta.verbose_name_plural
+            count = queryset.count()
+            counts[name] = counts.get(name, 0) + count
+            model_admin = self.admin_site._registry.get(queryset.model)
+            if (count and model_admin is not None
+                    and not model_admin.has_delete_permission(request)):
+                perms_needed.add(queryset.model._meta.verbose_name)
+        counts[User._meta.verbose_name_plural] = len(users)
+        return [str(user) for user in users], counts, perms_needed, []
+
+    def delete_model(self, request, obj):
+        delete_user(obj.pk)
+
+    def delete_queryset(self, request, queryset):
+        for user_id in queryset.values_list('pk', flat=True):
+            delete_user(user_id)
 
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(LargeTableAdmin):
     list_display = ('id', 'author', 'subscriber')
-    list_filter = ('author', 'subscriber')
+    list_select_related = ('author', 'subscriber')
+    search_fields = ('=author__username', '=subscriber__username')
+    autocomplete_fields = ('author', 'subscriber')
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+INDEXES = (
+    ('users_user_username_prefix_idx', 'users_user', 'username'),
+    ('users_user_email_prefix_idx', 'users_user', 'email'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    """Индексы для поиска пользователей по началу строки в админке.
+    Нужны только PostgreSQL, см. recipes/0005_prefix_search_indexes.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} '
+            f'(UPPER({column}::text) varchar_pattern_ops)')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
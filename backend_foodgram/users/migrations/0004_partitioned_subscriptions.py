@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import migrations
+
+from api.partitioning import create_partitioned, drop_partitioned
+
+TABLE = 'users_subscription'
+
+
+def create_table(apps, schema_editor):
+    """Секционированная копия подписок,
+    см. recipes/0009_partitioned_user_tables.
+    """
+    if (schema_editor.connection.vendor != 'postgresql'
+            or not settings.USER_TABLE_PARTITIONS):
+        return
+    create_partitioned(TABLE, settings.USER_TABLE_PARTITIONS)
+
+
+def drop_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    drop_partitioned(TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_index_audit'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_table, drop_table),
+    ]
@@ -18,18 +18,24 @@ class Subscription(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         verbose_name='Автор',
-        related_name='subscription'
+        related_name='subscription',
+        db_index=False,
     )
     subscriber = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         verbose_name='Подписчик',
-        related_name='subscriber'
+        related_name='subscriber',
+        db_index=False,
     )
 
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        indexes = [
+            models.Index(fields=['subscriber', 'author'],
+                         name='subscription_subscriber_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['author', 'subscriber'], name='unique_subscriptions'
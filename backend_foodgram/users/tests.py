@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.test import TestCase
+
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class UserAdminDeleteTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author', password='x')
+        Recipe.objects.create(author=self.author, name='Борщ', text='...',
+                              cooking_time=60, image='images/borsch.png')
+        self.staff = User.objects.create_user(
+            email='staff@example.com', username='staff', password='x',
+            is_staff=True)
+        self.url = f'/admin/users/user/{self.author.pk}/delete/'
+
+    def grant(self, *codenames):
+        self.staff.user_permissions.add(
+            *Permission.objects.filter(codename__in=codenames))
+        self.client.force_login(self.staff)
+
+    def test_related_delete_permissions_are_required(self):
+        self.grant('view_user', 'delete_user')
+        response = self.client.get(self.url)
+        lacking = {str(name) for name in response.context['perms_lacking']}
+        self.assertIn(str(Recipe._meta.verbose_name), lacking)
+        response = self.client.post(self.url, {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(User.objects.filter(pk=self.author.pk).exists())
+
+    def test_delete_with_related_permissions(self):
+        self.grant('view_user', 'delete_user', 'delete_recipe')
+        response = self.client.post(self.url, {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Recipe.objects.exists())